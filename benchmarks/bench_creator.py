@@ -0,0 +1,218 @@
+"""
+Benchmark the stages of dataset creation on synthetic data.
+
+For each data size synthetic MMS and label files are generated and served by
+a local stand-in for the MMS Science Data Center. Each stage of the dataset
+creation is timed and the results are written as JSON.
+
+Usage:
+    python benchmarks/bench_creator.py --hours 2 6 --output results.json
+"""
+from argparse import ArgumentParser
+from contextlib import redirect_stdout
+from os import path, makedirs
+import datetime as dt
+import io
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import cdflib
+import numpy as np
+import pandas as pd
+import pyarrow
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+import spacephyml
+from spacephyml.datasets import creator
+from spacephyml.utils import mms
+
+import fixtures
+import sdc_server
+
+_START = dt.datetime(2017, 11, 3)
+
+_DIST_VAR = 'mms1_dis_dist_fast'
+_MOMS_VARS = ['mms1_dis_energyspectr_omni_fast', 'mms1_dis_bulkv_gse_fast',
+              'mms1_dis_numberdensity_fast']
+
+
+def _timeit(func, repeat=1, setup=None, verbose=False):
+    """
+    Time func, returning the times of each run and the last result.
+    """
+    times = []
+    result = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        out = sys.stdout if verbose else io.StringIO()
+        with redirect_stdout(out):
+            start = time.perf_counter()
+            result = func()
+            times.append(time.perf_counter() - start)
+    return times, result
+
+
+def _format_time(t):
+    return t.strftime('%Y-%m-%d/%H:%M:%S')
+
+
+def run_size(workdir, hours, file_minutes, repeat, verbose=False):
+    """
+    Generate data for one size and time each stage of the dataset creation.
+
+    Returns:
+        Tuple with a dictionary describing the data and a dictionary with
+        the times of each stage.
+    """
+    serverdir = f'{workdir}/server'
+    datadir = f'{workdir}/data/'
+    makedirs(datadir, exist_ok=True)
+
+    size = fixtures.generate(serverdir, _START, hours, file_minutes)
+    httpd, api_url, labels_url, requests = sdc_server.serve(serverdir)
+
+    mms._MMS_DATA_BASE_URL = api_url
+    creator._MMS_DATA_DIR = datadir
+    creator._LABELS_URL_BASE = labels_url
+    tempfile.tempdir = f'{workdir}/tmp'
+    makedirs(tempfile.tempdir, exist_ok=True)
+
+    trange = [_START, _START + dt.timedelta(hours=hours)]
+    # get_dataset parses the time range in place, pass it a copy
+    trange_str = [_format_time(t) for t in trange]
+    var_list = [_DIST_VAR] + _MOMS_VARS
+    days = [trange[0].strftime('%Y-%m-%d'),
+            (trange[1] + dt.timedelta(days=1)).strftime('%Y-%m-%d')]
+
+    stages = {}
+
+    def timeit(name, func, repeat=1, setup=None):
+        stages[name], result = _timeit(func, repeat, setup, verbose)
+        return result
+
+    # Cold stages, these fill the caches and can only be timed once
+    timeit('file_list', lambda: [
+        mms.get_file_list(*days, **creator._VAR_TO_FILE_INFO[var]['info'],
+                          rootdir=datadir)
+        for var in [_DIST_VAR, _MOMS_VARS[0]]])
+    timeit('download', lambda: [creator._get_data_files(trange, var)
+                                for var in [_DIST_VAR, _MOMS_VARS[0]]])
+    timeit('epoch_index_cold', lambda: [
+        creator._EpochIndex(trange).file_epochs(var)
+        for var in [_DIST_VAR, _MOMS_VARS[0]]])
+
+    # Warm stages
+    timeit('epoch_index', lambda: [
+        creator._EpochIndex(trange).file_epochs(var)
+        for var in [_DIST_VAR, _MOMS_VARS[0]]], repeat)
+
+    labels = timeit('labels', lambda: creator._get_olshevsky_label_list(
+        trange, var_list=[]), repeat)
+
+    epoch_index = creator._EpochIndex(trange)
+
+    def reset_matches():
+        # Only time the matching, not loading the file epochs
+        epoch_index._matches = {}
+        for var in var_list:
+            epoch_index.file_epochs(var)
+
+    timeit('matching', lambda: [
+        creator._get_var_info(trange, var, labels['epoch'],
+                              epoch_index=epoch_index)
+        for var in var_list], repeat, reset_matches)
+
+    timeit('assembly', lambda: [creator._get_var(trange, var)
+                                for var in _MOMS_VARS], repeat)
+
+    labeled = timeit('olshevsky', lambda: creator.get_dataset(
+        'Olshevsky', list(trange_str), clean=False, var_list=var_list),
+        repeat)
+    timeit('unlabeled', lambda: creator.get_dataset(
+        'Unlabeled', list(trange_str), clean=False, var_list=var_list),
+        repeat)
+    timeit('resample', lambda: creator.get_dataset(
+        'Unlabeled', list(trange_str), clean=False, var_list=_MOMS_VARS,
+        resample='1min'), repeat)
+
+    metadata = {'trange': [trange_str], 'label_source': 'Olshevsky'}
+    for fileformat in ['csv', 'feather', 'parquet']:
+        timeit(f'write_{fileformat}', lambda: creator._write_dataset(
+            labeled, f'{workdir}/dataset.{fileformat}', metadata), repeat)
+
+    httpd.shutdown()
+
+    return {'hours': hours, 'samples': len(labeled), **size,
+            'requests': requests}, stages
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'],
+                              capture_output=True, text=True, check=True,
+                              cwd=path.dirname(path.abspath(__file__))
+                              ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    """
+    Run the benchmarks and write the results.
+    """
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('--hours', type=float, nargs='+', default=[2, 6],
+                        help='Data sizes, in hours of fast mode data')
+    parser.add_argument('--file-minutes', type=int, default=120,
+                        help='Length of each data file in minutes')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Number of runs for the warm stages')
+    parser.add_argument('--workdir', default=None,
+                        help='Directory for the generated files')
+    parser.add_argument('--output', default=None,
+                        help='JSON file to write the results to')
+    parser.add_argument('--verbose', action='store_true', default=False)
+    args = parser.parse_args()
+
+    results = {
+        'spacephyml': spacephyml.__version__,
+        'commit': _git_commit(),
+        'date': dt.datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'packages': {'numpy': np.__version__, 'pandas': pd.__version__,
+                     'cdflib': cdflib.__version__,
+                     'pyarrow': pyarrow.__version__},
+        'config': {'file_minutes': args.file_minutes,
+                   'repeat': args.repeat},
+        'results': [],
+    }
+
+    for hours in args.hours:
+        with tempfile.TemporaryDirectory(dir=args.workdir) as workdir:
+            data, stages = run_size(workdir, hours, args.file_minutes,
+                                    args.repeat, args.verbose)
+        tempfile.tempdir = None
+
+        print(f"{hours} h: {data['files']} files, "
+              f"{data['bytes'] / 1e6:.0f} MB, {data['samples']} samples")
+        for stage, times in stages.items():
+            print(f'  {stage:18s} {min(times):8.3f} s')
+            results['results'].append({**data, 'stage': stage,
+                                       'times': times, 'best': min(times),
+                                       'mean': float(np.mean(times))})
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=1)
+
+
+if __name__ == '__main__':
+    main()
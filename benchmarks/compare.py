@@ -0,0 +1,40 @@
+"""
+Compare two benchmark result files written by bench_creator.py.
+
+Usage:
+    python benchmarks/compare.py baseline.json results.json
+"""
+from argparse import ArgumentParser
+import json
+
+
+def _best_times(filepath):
+    with open(filepath, 'r', encoding='utf-8') as f:
+        results = json.load(f)
+    return {(r['hours'], r['stage']): r['best'] for r in results['results']}
+
+
+def main():
+    """
+    Print the speedup of each stage relative to the baseline.
+    """
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('baseline')
+    parser.add_argument('results')
+    args = parser.parse_args()
+
+    baseline = _best_times(args.baseline)
+    results = _best_times(args.results)
+
+    print(f"{'hours':>6s} {'stage':18s} {'baseline':>10s} {'new':>10s} "
+          f"{'speedup':>8s}")
+    for key, best in results.items():
+        if key not in baseline:
+            continue
+        hours, stage = key
+        print(f'{hours:6g} {stage:18s} {baseline[key]:10.3f} {best:10.3f} '
+              f'{baseline[key] / best:7.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""
+Generate synthetic MMS data and Olshevsky label files for benchmarking.
+
+The files follow the naming and layout of the MMS Science Data Center, with
+fast mode FPI dis-dist and dis-moms files at the 4.5 s fast mode cadence, and
+Olshevsky style monthly label files.
+"""
+from os import path, makedirs
+import datetime as dt
+import numpy as np
+from cdflib import cdfepoch
+from cdflib.cdfwrite import CDF
+
+# CDF data types
+_CDF_INT1 = 41
+_CDF_FLOAT = 21
+_CDF_TIME_TT2000 = 33
+
+_FAST_CADENCE = 4.5
+
+_MOMS_VARS = [('mms1_dis_energyspectr_omni_fast', (32,)),
+              ('mms1_dis_bulkv_gse_fast', (3,)),
+              ('mms1_dis_numberdensity_fast', ()),
+              ('mms1_dis_temppara_fast', ()),
+              ('mms1_dis_tempperp_fast', ())]
+
+
+def _write_cdf(filepath, variables):
+    """
+    Write a CDF file with the given (name, data type, data) variables.
+    """
+    makedirs(path.dirname(filepath), exist_ok=True)
+    cdf_file = CDF(filepath, cdf_spec={'rDim_sizes': []}, delete=True)
+    for name, data_type, data in variables:
+        cdf_file.write_var({'Variable': name, 'Data_Type': data_type,
+                            'Num_Elements': 1, 'Rec_Vary': True,
+                            'Dim_Sizes': list(data.shape[1:]),
+                            'Var_Type': 'zVariable', 'Compress': 0},
+                           var_data=data)
+    cdf_file.close()
+
+
+def _tt2000(time):
+    return cdfepoch.compute_tt2000([time.year, time.month, time.day,
+                                    time.hour, time.minute, time.second,
+                                    0, 0, 0])
+
+
+def generate(outdir, start, hours, file_minutes=120, seed=0):
+    """
+    Generate synthetic fast mode FPI files and Olshevsky label files.
+
+    The data files are stored directly in outdir, as expected by
+    sdc_server.serve, and the label files in '{outdir}/labels'.
+
+    Args:
+        outdir (string): Directory to store the files in.
+        start (datetime): Start time of the first file, in Nov. or Dec. 2017
+            to be covered by the Olshevsky labels.
+        hours (float): Length of the time range covered by the files.
+        file_minutes (int): Length of each data file.
+        seed (int): Seed for the random data.
+
+    Returns:
+        Dictionary with the number of files, the number of records per file
+        and the total size of the files in bytes.
+    """
+    rng = np.random.default_rng(seed)
+    records = int(file_minutes * 60 / _FAST_CADENCE)
+    num_files = int(np.ceil(hours * 60 / file_minutes))
+
+    labels = {'201711': [], '201712': []}
+    size = 0
+    for i in range(num_files):
+        t0 = start + dt.timedelta(minutes=i * file_minutes)
+        timetag = t0.strftime('%Y%m%d%H%M%S')
+        epochs = _tt2000(t0) + 30_000_000 + \
+            (np.arange(records) * _FAST_CADENCE * 1e9).astype(np.int64)
+
+        dist_file = f'{outdir}/mms1_fpi_fast_l2_dis-dist_{timetag}_v3.4.0.cdf'
+        _write_cdf(dist_file, [
+            ('Epoch', _CDF_TIME_TT2000, epochs),
+            ('mms1_dis_dist_fast', _CDF_FLOAT,
+             rng.random((records, 32, 16, 32), dtype=np.float32) * 1e-20)])
+
+        # The moments are stored one second after the distributions
+        moms_file = f'{outdir}/mms1_fpi_fast_l2_dis-moms_{timetag}_v3.4.0.cdf'
+        _write_cdf(moms_file, [('Epoch', _CDF_TIME_TT2000,
+                                epochs + 1_000_000_000)] +
+                   [(var, _CDF_FLOAT,
+                     rng.random((records,) + shape, dtype=np.float32))
+                    for var, shape in _MOMS_VARS])
+        size += path.getsize(dist_file) + path.getsize(moms_file)
+
+        # The labels are offset from the data, and reach past the end of
+        # each file so that some labels are not matched.
+        label_epochs = _tt2000(t0) + \
+            (np.arange(records + 20) * _FAST_CADENCE * 1e9).astype(np.int64)
+        labels[t0.strftime('%Y%m')].append(
+            (timetag, rng.integers(-1, 4, len(label_epochs)).astype(np.int8),
+             label_epochs))
+
+    for month, month_labels in labels.items():
+        variables = \
+            [(f'label_fpi_fast_dis_dist_mms1_{timetag}', _CDF_INT1, label)
+             for timetag, label, _ in month_labels] + \
+            [(f'epoch_fpi_fast_dis_dist_mms1_{timetag}', _CDF_TIME_TT2000,
+              epochs) for timetag, _, epochs in month_labels]
+        if not variables:
+            variables = [('empty', _CDF_FLOAT, np.zeros(1, dtype=np.float32))]
+        _write_cdf(f'{outdir}/labels/labels_fpi_fast_dis_dist_{month}.cdf',
+                   variables)
+
+    return {'files': num_files, 'records': records, 'bytes': size}
@@ -0,0 +1,103 @@
+"""
+A local stand-in for the MMS Science Data Center API and the Olshevsky label
+repository, serving files generated by fixtures.generate.
+"""
+from os import path, listdir
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import threading
+import json
+
+
+class _SDCHandler(BaseHTTPRequestHandler):
+    """
+    Handle file_info and download requests, and label file requests.
+    """
+    datadir = None
+    requests = None
+
+    def log_message(self, *args):
+        pass
+
+    def _file_info(self, query):
+        start = query['start_date'][0].replace('-', '')
+        end = query['end_date'][0].replace('-', '')
+        prefix = '_'.join([query['sc_id'][0], query['instrument_id'][0],
+                           query['data_rate_mode'][0],
+                           query['data_level'][0]])
+        if 'descriptor' in query:
+            prefix += '_' + query['descriptor'][0]
+
+        files = []
+        for filename in sorted(listdir(self.datadir)):
+            fs = filename.split('_')
+            if filename.endswith('.cdf') and '_'.join(fs[:-2]) == prefix \
+                    and start <= fs[-2][:8] < end:
+                files.append({'file_name': filename,
+                              'file_size': path.getsize(
+                                  f'{self.datadir}/{filename}'),
+                              'timetag': fs[-2]})
+
+        body = json.dumps({'files': files}).encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_file(self, filepath):
+        if not path.isfile(filepath):
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        with open(filepath, 'rb') as f:
+            data = f.read()
+
+        start = 0
+        if 'Range' in self.headers:
+            start = int(self.headers['Range'].split('=')[1].split('-')[0])
+            self.send_response(206)
+            self.send_header('Content-Range',
+                             f'bytes {start}-{len(data)-1}/{len(data)}')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(data) - start))
+        self.end_headers()
+        self.wfile.write(data[start:])
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+
+        if url.path.endswith('file_info/science'):
+            self.requests['file_info'] += 1
+            self._file_info(query)
+        elif url.path.endswith('download/science'):
+            self.requests['download'] += 1
+            self._send_file(f"{self.datadir}/{path.basename(query['file'][0])}")
+        else:
+            self.requests['labels'] += 1
+            self._send_file(f'{self.datadir}/labels/{path.basename(url.path)}')
+
+
+def serve(datadir):
+    """
+    Serve the files in datadir on a local port, in a background thread.
+
+    Args:
+        datadir (string): Directory with the files from fixtures.generate.
+
+    Returns:
+        Tuple with the server, the base URL of the SDC API (to use as
+        spacephyml.utils.mms._MMS_DATA_BASE_URL), the base URL for the
+        label files and a dictionary counting the requests made.
+    """
+    requests = {'file_info': 0, 'download': 0, 'labels': 0}
+    handler = type('SDCHandler', (_SDCHandler,),
+                   {'datadir': datadir, 'requests': requests})
+
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+
+    url = f'http://127.0.0.1:{httpd.server_address[1]}/'
+    return httpd, url + 'api/v1/', url + 'labels/', requests
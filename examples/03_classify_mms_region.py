@@ -23,7 +23,8 @@ create_dataset('./mms_region.csv',
                var_list=['mms1_dis_dist_fast'])
 
 dataset = ExternalMMSData('./mms_region.csv',
-                          transform = MMS1IonDistLabeled_Transform())
+                          transform = MMS1IonDistLabeled_Transform(),
+                          prefetch = 2)
 
 model = PCReduced('s42').to(device)
 
@@ -18,3 +18,9 @@ if 'MMS_DATA_DIR' in environ:
     _MMS_DATA_DIR = environ['MMS_DATA_DIR']
 elif 'SPEDAS_DATA_DIR' in environ:
     _MMS_DATA_DIR = environ['SPEDAS_DATA_DIR']
+
+# Number of concurrent downloads of data files
+_DOWNLOAD_WORKERS = int(environ.get('SPACEPHYML_DOWNLOAD_WORKERS', 4))
+
+# Number of CDF files kept open for reading, per process
+_MAX_OPEN_CDF_FILES = int(environ.get('SPACEPHYML_MAX_OPEN_CDF_FILES', 32))
@@ -3,6 +3,7 @@ Script for creating dataset based on exisiting labels.
 """
 from argparse import ArgumentParser
 from .datasets.creator import create_dataset, _VAR_TO_FILE_INFO
+from .datasets.general.mms import ExternalMMSData
 
 
 def create_action(args):
@@ -15,16 +16,30 @@ def create_action(args):
     trange = [args.start, args.end]
     kwargs = {
         'force': args.force,
+        'append': args.append,
+        'compression': args.compression,
         'samples': args.samples,
         'clean': args.clean,
         'var_list': args.var,
         'resample': args.resample,
         'label_source': args.label_source,
+        'tolerance': args.tolerance,
+        'offline': args.offline,
+        'chunk': args.chunk,
+        'materialize': args.materialize,
     }
 
     create_dataset(args.output, trange, **kwargs)
 
 
+def verify_action(args):
+    """
+    Run the verify action.
+    """
+    ExternalMMSData(args.dataset, rootdir=args.rootdir, verify=True)
+    print('All data files verified')
+
+
 def pars_args():
     """
     Parse commandline arguments.
@@ -41,14 +56,32 @@ def pars_args():
     create.add_argument('--end', default='2017-11-30',
                         help='End date, format YYYY-MM-DD/HH:MM:DD')
     create.add_argument('--force', action='store_true', default=False)
+    create.add_argument('--append', action='store_true', default=False,
+                        help='Add the missing time range to an existing dataset')
     create.add_argument('--clean', action='store_true', default=False)
+    create.add_argument('--offline', action='store_true', default=False,
+                        help='Only use cached file lists and local data')
     create.add_argument('--samples', default=0)
+    create.add_argument('--compression', default='zstd',
+                        help='Compression for feather and parquet output')
     create.add_argument('--resample', default=None)
+    create.add_argument('--chunk', default=None,
+                        help='Resample one time window (e.g. 1D) at the time')
+    create.add_argument('--materialize', action='store_true', default=False,
+                        help='Also store the samples in a memory mapped store')
+    create.add_argument('--tolerance', default=4.5, type=float,
+                        help='Largest time difference (s) when matching epochs')
     create.add_argument('--var',
                         action='append',
                         choices=_VAR_TO_FILE_INFO.keys())
     create.add_argument('output')
 
+    verify = actions.add_parser(
+        'verify', help='Verify, and re-download, the data files of a dataset')
+    verify.add_argument('--rootdir', default=None,
+                        help='Root directory of the MMS data files')
+    verify.add_argument('dataset')
+
     args = parser.parse_args()
 
     print("Arguments:")
@@ -65,6 +98,8 @@ def main():
     args = pars_args()
     if args.command == 'create':
         create_action(args)
+    elif args.command == 'verify':
+        verify_action(args)
 
 
 if __name__ == "__main__":
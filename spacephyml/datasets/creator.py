@@ -2,15 +2,23 @@
 Script for creating dataset based on exisiting labels.
 """
 import tempfile
-from os import path, makedirs, remove
+import inspect
+import json
+from os import path, makedirs, remove, replace, getpid
+from shutil import rmtree
 import datetime as dt
 from cdflib import cdfepoch
 
 import pandas as pd
 import numpy as np
-
-from ..__init__ import _MMS_DATA_DIR
-from ..utils import read_cdf_file
+import pyarrow as pa
+from pyarrow import feather
+import pyarrow.parquet as pq
+from numpy.lib.format import open_memmap
+
+from ..__init__ import _MMS_DATA_DIR, _DOWNLOAD_WORKERS
+from ..utils import read_cdf_file, pandas_read_file
+from ..utils.epochs import read_cdf_epochs, epoch_to_record
 from ..utils.file_download import download_file_with_status, missing_files
 from ..utils import mms
 
@@ -19,12 +27,17 @@ _LABELS_URL_BASE = 'https://bitbucket.org/volshevsky/mmslearning/' + \
 _LABELS_FILENAME_BASE = 'labels_fpi_fast_dis_dist_'
 
 
-def _download_label_file(outputpath, filedate):
+def _download_label_file(outputpath, filedate, offline=False):
     """
     Download Olshevsky label files.
     """
     makedirs(outputpath, exist_ok=True)
     file = _LABELS_FILENAME_BASE + filedate + '.cdf'
+    if offline:
+        if not path.isfile(outputpath + file):
+            raise ValueError(f'Label file {outputpath + file} is missing, ' +
+                             'cannot download in offline mode')
+        return outputpath + file
     download_file_with_status(_LABELS_URL_BASE + file, outputpath + file)
     return outputpath + file
 
@@ -37,57 +50,194 @@ https://doi.org/10.1029/2021JA029620
 """
 
 
-def _get_var_info(trange, var, epochs=None):
+def _match_epochs(file_epochs, epochs, tolerance=4.5):
+    """
+    Find the closest file epoch for each of the given epochs.
+
+    Args:
+        file_epochs (array): The CDF TT2000 epochs available in the files.
+        epochs (array): The CDF TT2000 epochs to match.
+        tolerance (float): The largest allowed time difference, in seconds.
+
+    Returns:
+        Tuple with the index into file_epochs for each epoch and a boolean
+        array which is False for epochs without a file epoch within the
+        tolerance.
+    """
+    file_epochs = np.asarray(file_epochs, dtype=np.int64)
+    epochs = np.asarray(epochs, dtype=np.int64)
+
+    order = np.argsort(file_epochs, kind='stable')
+    sorted_epochs = file_epochs[order]
+
+    # The closest epoch is either the one before or after the insertion point,
+    # on ties the earlier epoch is used.
+    right = np.searchsorted(sorted_epochs, epochs, side='left')
+    right = np.clip(right, 0, len(sorted_epochs) - 1)
+    left = np.clip(right - 1, 0, len(sorted_epochs) - 1)
+    use_left = (np.abs(epochs - sorted_epochs[left]) <=
+                np.abs(sorted_epochs[right] - epochs))
+    closest = np.where(use_left, left, right)
+
+    # Use the first occurrence for epochs present in multiple files
+    closest = np.searchsorted(sorted_epochs, sorted_epochs[closest],
+                              side='left')
+    index = order[closest]
+
+    # Compare in UTC (as cdfepoch.unixtime) so leap seconds are not counted
+    time_diff = np.abs(cdfepoch.to_datetime(epochs) -
+                       cdfepoch.to_datetime(file_epochs[index]))
+    valid = time_diff <= np.timedelta64(int(tolerance * 1e9), 'ns')
+
+    return index, valid
+
+
+def _get_data_files(trange, var, offline=False):
+    """
+    Get the names of the data files containing a varible in the time range,
+    downloading the files missing locally.
+    """
     # The MMS Data API takes the end date as exclusive
     trange = [trange[0].strftime("%Y-%m-%d"),
               (trange[1] + dt.timedelta(days=1)).strftime("%Y-%m-%d")]
 
     # Check which datafiles are relevant
     files = mms.get_file_list(trange[0], trange[1],
-                              **_VAR_TO_FILE_INFO[var]['info'])
+                              **_VAR_TO_FILE_INFO[var]['info'],
+                              rootdir=_MMS_DATA_DIR, offline=offline)
     files = [f['file_name'] for f in files]
+    if not files:
+        raise ValueError(f'No data files found for {var}')
+
     filespaths = mms.filename_to_filepath(files)
+    if isinstance(filespaths, str):
+        filespaths = [filespaths]
 
     # Download missing
     missing = missing_files(filespaths, _MMS_DATA_DIR)
+    if missing and offline:
+        raise ValueError(f'{len(missing)} data files are missing, ' +
+                         'cannot download in offline mode')
     if missing:
         print(f"{len(missing)} data files are missing, downloading")
-        mms.download_cdf_files(_MMS_DATA_DIR, missing)
+        mms.download_cdf_files(_MMS_DATA_DIR, missing,
+                               workers=_DOWNLOAD_WORKERS)
+
+    return files
+
+
+def _load_file_epochs(trange, var, offline=False):
+    """
+    Load the epochs from all data files containing a varible.
+
+    Returns:
+        Tuple with an array of the file names, an array with the file index
+        for each epoch and an array with the epochs.
+    """
+    files = _get_data_files(trange, var, offline)
 
     # Load all the epochs
     file_epochs = []
-    file_names = []
-    for filename in files:
-        filepath = mms.filename_to_filepath(filename)
-        cdf_file = read_cdf_file(_MMS_DATA_DIR + filepath)
-        tmp = cdf_file.varget('Epoch')
-        file_epochs.extend(tmp)
-        file_names.extend([filename for _ in tmp])
-    file_epochs = np.array(file_epochs)
+    file_index = []
+    for i, filename in enumerate(files):
+        tmp = read_cdf_epochs(_MMS_DATA_DIR,
+                              mms.filename_to_filepath(filename))
+        file_epochs.append(tmp)
+        file_index.append(np.full(len(tmp), i))
+
+    return (np.array(files, dtype=object), np.concatenate(file_index),
+            np.concatenate(file_epochs))
 
-    if epochs is None:
-        # If we don't have any epochs to sort on, return everything
-        return file_names, file_epochs
 
-    files_add = []
-    epochs_add = np.zeros(len(epochs)).astype(np.int64)
-    # For each labeled epoch find the closes from the file
-    for j, epoch_labeled in enumerate(epochs):
-        index = np.abs(file_epochs - epoch_labeled).argmin()
-        epochs_add[j] = file_epochs[index]
-        files_add.append(file_names[index])
+def _file_group(var):
+    """
+    The key for the data files a varible is stored in.
+    """
+    info = _VAR_TO_FILE_INFO[var]['info']
+    return (info.get('instrument'), info.get('data_rate'),
+            info.get('datatype'))
 
-        # If the time difference is larger than between the
-        # labeled epochs, set 0
-        time_diff = np.abs(cdfepoch.unixtime(epoch_labeled)
-                           - cdfepoch.unixtime(epochs_add[j]))
-        if time_diff > 4.5:
-            epochs_add[j] = 0
 
-    return files_add, epochs_add
+class _EpochIndex():
+    """
+    Index over the data file epochs used while building one dataset.
+
+    Varibles stored in the same data files (same instrument, data rate and
+    datatype) share the loaded file epochs, and the result of matching them
+    against the labeled epochs.
+
+    Args:
+        trange (List): List with the start and end datetime for the dataset.
+        tolerance (float): The largest allowed time difference, in seconds,
+            when matching epochs.
+        offline (bool): Only use local data files.
+    """
+    def __init__(self, trange, tolerance=4.5, offline=False):
+        self.trange = trange
+        self.tolerance = tolerance
+        self.offline = offline
+        self._files = {}
+        self._matches = {}
+
+    def file_epochs(self, var):
+        """
+        Get the file names, file index and epochs for the files of a varible.
+        """
+        key = _file_group(var)
+        if key not in self._files:
+            self._files[key] = _load_file_epochs(self.trange, var,
+                                                 self.offline)
+        return self._files[key]
+
+    def match(self, var, epochs):
+        """
+        Match epochs against the files of a varible.
+
+        Args:
+            var (string): The varible to match against.
+            epochs (pandas Series): The epochs to match.
+
+        Returns:
+            Tuple with a list of file names and an array with the matched
+            epochs, set to 0 where no epoch is within the tolerance.
+        """
+        key = _file_group(var)
+        match = self._matches.get(key)
+
+        # Rows are only dropped between varibles, so a previous match can be
+        # reused as long as it covers all the requested rows.
+        if match is None or not epochs.index.isin(match.index).all() or \
+                not np.array_equal(match.loc[epochs.index, 'label epoch'],
+                                   epochs):
+            files, file_index, file_epochs = self.file_epochs(var)
+            index, valid = _match_epochs(file_epochs, epochs, self.tolerance)
+            match = pd.DataFrame({'file': files[file_index[index]],
+                                  'epoch': np.where(valid,
+                                                    file_epochs[index], 0),
+                                  'label epoch': np.asarray(epochs)},
+                                 index=epochs.index)
+            self._matches[key] = match
+
+        match = match.loc[epochs.index]
+        return list(match['file']), match['epoch'].to_numpy()
+
+
+def _get_var_info(trange, var, epochs=None, tolerance=4.5, epoch_index=None):
+    if epoch_index is None:
+        epoch_index = _EpochIndex(trange, tolerance)
+
+    if epochs is None:
+        # If we don't have any epochs to sort on, return everything
+        files, file_index, file_epochs = epoch_index.file_epochs(var)
+        return list(files[file_index]), file_epochs
+
+    # For each labeled epoch find the closes from the file, if the time
+    # difference is larger than between the labeled epochs, set 0
+    return epoch_index.match(var, pd.Series(epochs))
 
 
-def _get_olshevsky_label_list(trange=None, var_list=None, resample=None):
+def _get_olshevsky_label_list(trange=None, var_list=None, resample=None,
+                              tolerance=4.5, offline=False):
     """
     Get a pandoc DataFrame containing all the Olshevsky labels from within the
     given time range.
@@ -108,7 +258,7 @@ def _get_olshevsky_label_list(trange=None, var_list=None, resample=None):
     # Download the labelfiles from Olshevsky
     print('Downloading Olshevsky label files.')
     label_files = [_download_label_file(tempfile.gettempdir() +
-                   '/mms_labels/', d) for d in ['201711', '201712']]
+                   '/mms_labels/', d, offline) for d in ['201711', '201712']]
 
     data = {'label': [], 'epoch': [], 'date': []}
     for file in label_files:
@@ -138,12 +288,14 @@ def _get_olshevsky_label_list(trange=None, var_list=None, resample=None):
     data = data.loc[(trange[0] <= data['Time']) &
                     (data['Time'] < trange[1])]
 
+    epoch_index = _EpochIndex(trange, tolerance, offline)
     for i, var in enumerate(var_list):
         print(f'Processing varible: {var}')
         if var not in _VAR_TO_FILE_INFO:
             raise ValueError(f'Invalid var requested: {var}')
 
-        files_add, epochs_add = _get_var_info(trange, var, data['epoch'])
+        files_add, epochs_add = _get_var_info(trange, var, data['epoch'],
+                                              epoch_index=epoch_index)
 
         data[f'epoch {i}'] = epochs_add
         data[f'file {i}'] = files_add
@@ -158,47 +310,118 @@ def _get_olshevsky_label_list(trange=None, var_list=None, resample=None):
     return data.reset_index(drop=True).drop(columns=['date'])
 
 
-def _get_var(trange, var):
+def _read_var_file(filename, var):
+    """
+    Read a varible from one data file.
 
-    # The MMS Data API takes the end date as exclusive
-    trange = [trange[0].strftime("%Y-%m-%d"),
-              (trange[1] + dt.timedelta(days=1)).strftime("%Y-%m-%d")]
+    Returns:
+        Tuple with the epochs and a 2D array with one column for each entry in
+        the varible mapping.
+    """
+    filepath = mms.filename_to_filepath(filename)
+    var_data = read_cdf_file(_MMS_DATA_DIR + filepath, [('var', var)])['var']
 
-    # Check which datafiles are relevant
-    files = mms.get_file_list(trange[0], trange[1],
-                              **_VAR_TO_FILE_INFO[var]['info'])
+    mapping = _VAR_TO_FILE_INFO[var]['mapping']
+    if len(mapping) > 1:
+        var_data = var_data[:, [i for _, i in mapping]]
 
-    files = [f['file_name'] for f in files]
-    filespaths = mms.filename_to_filepath(files)
+    return (read_cdf_epochs(_MMS_DATA_DIR, filepath),
+            var_data.reshape(len(var_data), -1))
 
-    # Download missing
-    missing = missing_files(filespaths, _MMS_DATA_DIR)
-    if missing:
-        print(f"{len(missing)} data files are missing, downloading")
-        mms.download_cdf_files(_MMS_DATA_DIR, missing)
-
-    # Load all the file data
-    df = None
-    for filename in files:
-        filepath = mms.filename_to_filepath(filename)
-        cdf_file = read_cdf_file(_MMS_DATA_DIR + filepath)
-        var_data = cdf_file.varget(var)
-        if len(_VAR_TO_FILE_INFO[var]['mapping']) > 1:
-            tmp = {k: var_data[:, i]
-                   for k, i in _VAR_TO_FILE_INFO[var]['mapping']}
 
-        else:
-            tmp = {k: var_data[:]
-                   for k, _ in _VAR_TO_FILE_INFO[var]['mapping']}
+def _var_frame(var, blocks):
+    """
+    Assemble the blocks read by _read_var_file into one DataFrame, indexed by
+    time.
+    """
+    epochs = np.concatenate([epochs for epochs, _ in blocks])
+    values = np.concatenate([values for _, values in blocks])
+
+    return pd.DataFrame(values,
+                        columns=[k for k, _ in _VAR_TO_FILE_INFO[var]['mapping']],
+                        index=pd.DatetimeIndex(cdfepoch.to_datetime(epochs)))
+
 
-        df = pd.concat([df, pd.DataFrame(tmp, index=pd.to_datetime(
-                       cdfepoch.unixtime(cdf_file.varget('epoch')),
-                       unit='s'))])
+def _get_var(trange, var, offline=False):
+    files = _get_data_files(trange, var, offline)
 
-    return df.sort_index()
+    # Load all the file data, and assemble it once
+    blocks = [_read_var_file(filename, var) for filename in files]
 
+    return _var_frame(var, blocks).sort_index()
 
-def _get_unlabeled_list(trange=None, var_list=None):
+
+def _get_var_resampled_chunked(trange, var_list, resample, chunk,
+                               offline=False):
+    """
+    Resample the varibles one time window at the time, so only the data for
+    one window is kept in memory.
+
+    The files for each varible are read in time order, by the window their
+    filename start time is in. The data of a window is resampled once the
+    files of the next window are read, as files can contain data from
+    before their start time (e.g. daily files starting before midnight), so
+    data is kept for one window longer. The windows are aligned with the
+    resample bins, so the result is the same as resampling all the data at
+    once.
+    """
+    try:
+        freq = pd.Timedelta(pd.tseries.frequencies.to_offset(resample))
+    except ValueError as err:
+        raise ValueError('Chunked resampling requires a fixed resample ' +
+                         f'frequency, not {resample}') from err
+
+    # Round the chunk to a whole number of resample bins
+    chunk = max(1, round(pd.Timedelta(chunk) / freq)) * freq
+    origin = pd.Timestamp(trange[0]).normalize()
+
+    files = {}
+    for var in var_list:
+        print(f'Processing varible: {var}')
+        if var not in _VAR_TO_FILE_INFO:
+            raise ValueError(f'Invalid var requested: {var}')
+        files[var] = _get_data_files(trange, var, offline)
+
+    # Assign each file to the window it starts in
+    windows = {var: {} for var in var_list}
+    for var in var_list:
+        for filename in files[var]:
+            file_time = mms._file_start(filename)
+            window = max(0, (pd.Timestamp(file_time) - origin) // chunk)
+            windows[var].setdefault(window, []).append(filename)
+    last_window = max(max(w) for w in windows.values())
+
+    carry = {var: None for var in var_list}
+    result = []
+    window = 0
+    while window <= last_window or \
+            any(c is not None and len(c.index) > 0 for c in carry.values()):
+        # Resample the data before this window
+        window_end = origin + window * chunk
+
+        df = pd.DataFrame()
+        for var in var_list:
+            blocks = [_read_var_file(filename, var)
+                      for filename in windows[var].get(window, [])]
+            var_df = carry[var]
+            if blocks:
+                var_df = pd.concat([var_df, _var_frame(var, blocks)])
+            if var_df is None:
+                continue
+
+            carry[var] = var_df.loc[var_df.index >= window_end]
+            df = df.join(var_df.loc[var_df.index < window_end].sort_index(),
+                         how='outer')
+
+        if len(df.index) > 0:
+            result.append(df.resample(resample, origin=origin).mean())
+        window += 1
+
+    return pd.concat(result)
+
+
+def _get_unlabeled_list(trange=None, var_list=None, tolerance=4.5,
+                        offline=False):
     """
     Get a pandoc DataFrame containing unlabeled epochs in a given
     time range.
@@ -207,7 +430,8 @@ def _get_unlabeled_list(trange=None, var_list=None):
     droped_rows = 0
 
     # Grab relevant epochs from the first varible
-    _, epochs = _get_var_info(trange, var_list[0])
+    epoch_index = _EpochIndex(trange, tolerance, offline)
+    _, epochs = _get_var_info(trange, var_list[0], epoch_index=epoch_index)
 
     data = pd.DataFrame({'epoch': epochs})
     data['label'] = -1  # Everything is unlabeled
@@ -220,7 +444,8 @@ def _get_unlabeled_list(trange=None, var_list=None):
         if var not in _VAR_TO_FILE_INFO:
             raise ValueError(f'Invalid var requested: {var}')
 
-        files_add, epochs_add = _get_var_info(trange, var, data['epoch'])
+        files_add, epochs_add = _get_var_info(trange, var, data['epoch'],
+                                              epoch_index=epoch_index)
 
         data[f'epoch {i}'] = epochs_add
         data[f'file {i}'] = files_add
@@ -237,12 +462,17 @@ def _get_unlabeled_list(trange=None, var_list=None):
     return data.reset_index(drop=True)
 
 
-def _get_unlabeled_dataset(trange, var_list=None, resample=None):
+def _get_unlabeled_dataset(trange, var_list=None, resample=None,
+                           tolerance=4.5, offline=False, chunk=None):
     """
     Get a list of data in a given timerange.
     """
 
-    if resample is not None:
+    if resample is not None and chunk is not None:
+        df_full = _get_var_resampled_chunked(trange, var_list, resample, chunk,
+                                             offline)
+
+    elif resample is not None:
         df_full = pd.DataFrame()
         for i, var in enumerate(var_list):
             print(f'Processing varible: {var}')
@@ -250,17 +480,18 @@ def _get_unlabeled_dataset(trange, var_list=None, resample=None):
                 raise ValueError(f'Invalid var requested: {var}')
 
             df_full = df_full.join(
-                _get_var(trange, var), how='outer')
+                _get_var(trange, var, offline), how='outer')
 
         df_full = df_full.resample(resample).mean()
 
+    if resample is not None:
         df_full['label'] = -1
         df_full = df_full.sort_index()
 
         df_full = df_full.loc[(trange[0] <= df_full.index) &
                               (df_full.index < trange[1])]
     else:
-        df_full = _get_unlabeled_list(trange, var_list)
+        df_full = _get_unlabeled_list(trange, var_list, tolerance, offline)
 
     return df_full.dropna()
 
@@ -309,8 +540,26 @@ _VAR_TO_FILE_INFO = {
 }
 
 
+def _parse_time(t):
+    """
+    Parse a time string with the format YYYY-mm-DD or YYYY-mm-DD/HH:MM:SS.
+    """
+    if isinstance(t, dt.datetime):
+        return t
+    if len(t) == 10:
+        return dt.datetime.strptime(t, '%Y-%m-%d')
+    if len(t) == 19:
+        return dt.datetime.strptime(t, '%Y-%m-%d/%H:%M:%S')
+    raise ValueError(f'Incorrect datetime format: {t}')
+
+
+def _format_time(t):
+    return t.strftime('%Y-%m-%d/%H:%M:%S')
+
+
 def get_dataset(label_source, trange, resample=None, clean=True, samples=0,
-                var_list=['mms1_dis_dist_fast']):
+                var_list=['mms1_dis_dist_fast'], tolerance=4.5,
+                offline=False, chunk=None):
     """
     Get a dataset based on a given config.
 
@@ -324,27 +573,35 @@ def get_dataset(label_source, trange, resample=None, clean=True, samples=0,
         clean (Bool): If unknown (-1) labels should be removed.
         samples (Integer): The number of samples per label, set to 0 for all samples.
         var_list (List): List of varibles to get from the CDF-files
+        tolerance (float): The largest time difference, in seconds, allowed
+            between a labeled epoch and the closest epoch in the data files.
+            Samples without data within the tolerance are dropped.
+        offline (Bool): Create the dataset without network access, using
+            cached file lists and data files already stored locally.
+        chunk (string): Resample the data one time window of this length
+            (e.g. '1D') at the time, to limit the memory used for long time
+            ranges. Only used together with resample.
 
     Returns:
         A pandas DataFrame with the created dataset.
     """
 
     for i, t in enumerate(trange):
-        if len(t) == 10:
-            trange[i] = dt.datetime.strptime(t, '%Y-%m-%d')
-        elif len(t) == 19:
-            trange[i] = dt.datetime.strptime(t, '%Y-%m-%d/%H:%M:%S')
-        else:
-            raise ValueError(f'Incorrect datetime format: {t}')
+        trange[i] = _parse_time(t)
 
     if label_source == 'Olshevsky':
         print('Generating a mms dataset based on labels from ')
         print(f'\t{_OLSHEVSKY_REF}')
         dataset = _get_olshevsky_label_list(trange, resample=resample,
-                                            var_list=var_list)
+                                            var_list=var_list,
+                                            tolerance=tolerance,
+                                            offline=offline)
 
     elif label_source == 'Unlabeled':
-        dataset = _get_unlabeled_dataset(trange, resample=resample, var_list=var_list)
+        dataset = _get_unlabeled_dataset(trange, resample=resample,
+                                         var_list=var_list,
+                                         tolerance=tolerance,
+                                         offline=offline, chunk=chunk)
 
     else:
         raise ValueError(f'Incorrect label_source ({label_source})')
@@ -366,16 +623,276 @@ def get_dataset(label_source, trange, resample=None, clean=True, samples=0,
     return dataset
 
 
+# The get_dataset arguments that have to match when appending to a dataset
+_METADATA_OPTIONS = ['label_source', 'var_list', 'resample', 'clean',
+                     'tolerance']
+_METADATA_KEY = b'spacephyml'
+
+
+def _read_metadata(dataset_path):
+    """
+    Read the SpacePhyML metadata of a dataset file, stored in the schema
+    metadata for feather and Parquet files and in a '{dataset_path}.json'
+    file for CSV.
+
+    Returns:
+        A dictionary with the metadata, or None if the file has none.
+    """
+    _, fileformat = path.splitext(dataset_path)
+    if fileformat == '.csv':
+        if not path.isfile(f'{dataset_path}.json'):
+            return None
+        with open(f'{dataset_path}.json', 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    if fileformat == '.feather':
+        metadata = feather.read_table(dataset_path,
+                                      columns=[]).schema.metadata or {}
+    elif fileformat == '.parquet':
+        metadata = pq.ParquetDataset(dataset_path).schema.metadata or {}
+    else:
+        raise ValueError(f'Unknown filetype {fileformat}')
+
+    if _METADATA_KEY not in metadata:
+        return None
+    return json.loads(metadata[_METADATA_KEY])
+
+
+def _read_dataset(dataset_path, metadata):
+    """
+    Read a dataset written by _write_dataset, with the original index.
+    """
+    _, fileformat = path.splitext(dataset_path)
+    if fileformat == '.csv':
+        dataset = pd.read_csv(dataset_path, index_col=0)
+        if metadata['resample'] is not None:
+            dataset.index = pd.to_datetime(dataset.index)
+        else:
+            dataset['Time'] = pd.to_datetime(dataset['Time'])
+        return dataset
+
+    return pandas_read_file(dataset_path)
+
+
+def _write_parquet(dataset, dataset_path, metadata, compression):
+    """
+    Write a dataset as a Parquet dataset directory, partitioned by month.
+
+    The file and varible name columns are dictionary encoded, and are read
+    back as pandas categoricals.
+    """
+    if isinstance(dataset.index, pd.DatetimeIndex):
+        dataset = dataset.rename_axis('Time')
+        time = dataset.index
+    else:
+        time = pd.DatetimeIndex(dataset['Time'])
+
+    dataset = dataset.assign(month=time.strftime('%Y-%m'))
+    for col in dataset.columns:
+        if col.startswith('file ') or col.startswith('var_name '):
+            dataset[col] = dataset[col].astype('category')
+
+    table = pa.Table.from_pandas(
+        dataset, preserve_index=isinstance(dataset.index, pd.DatetimeIndex))
+    table = table.replace_schema_metadata(
+        {**(table.schema.metadata or {}),
+         _METADATA_KEY: json.dumps(metadata).encode()})
+
+    pq.write_to_dataset(table, dataset_path, partition_cols=['month'],
+                        compression=compression,
+                        basename_template='part-{i}.parquet',
+                        existing_data_behavior='delete_matching')
+
+
+def _write_dataset(dataset, dataset_path, metadata, compression='zstd'):
+    """
+    Write a dataset together with its metadata.
+    """
+    _, fileformat = path.splitext(dataset_path)
+    if fileformat == '.csv':
+        dataset.to_csv(dataset_path)
+        with open(f'{dataset_path}.json', 'w', encoding='utf-8') as f:
+            json.dump(metadata, f)
+    elif fileformat == '.feather':
+        table = pa.Table.from_pandas(dataset)
+        table = table.replace_schema_metadata(
+            {**(table.schema.metadata or {}),
+             _METADATA_KEY: json.dumps(metadata).encode()})
+        feather.write_feather(table, dataset_path, compression=compression)
+    elif fileformat == '.parquet':
+        _write_parquet(dataset, dataset_path, metadata, compression)
+    else:
+        raise ValueError(f'Unknown filetype {fileformat}')
+
+
+def _missing_intervals(covered, trange):
+    """
+    Get the parts of trange not covered by any of the covered intervals.
+    """
+    missing = []
+    start = trange[0]
+    for c_start, c_end in sorted(covered):
+        if c_start > start:
+            missing.append([start, min(c_start, trange[1])])
+        start = max(start, c_end)
+        if start >= trange[1]:
+            break
+    if start < trange[1]:
+        missing.append([start, trange[1]])
+
+    return [m for m in missing if m[0] < m[1]]
+
+
+def _merge_intervals(intervals):
+    """
+    Merge overlapping and adjacent intervals.
+    """
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def _append_dataset(dataset_path, trange, options, compression, **kwargs):
+    """
+    Add the parts of trange missing in an existing dataset file.
+    """
+    metadata = _read_metadata(dataset_path)
+    if metadata is None:
+        raise ValueError(f'{dataset_path} has no metadata, cannot append')
+
+    for option in _METADATA_OPTIONS:
+        if metadata[option] != options[option]:
+            raise ValueError(f'Cannot append, {option} differ from the ' +
+                             f'dataset ({metadata[option]})')
+
+    covered = [[_parse_time(s), _parse_time(e)] for s, e in metadata['trange']]
+    missing = _missing_intervals(covered, trange)
+    if not missing:
+        print('Dataset already covers the time range')
+        return
+
+    datasets = [_read_dataset(dataset_path, metadata)]
+    for start, end in missing:
+        print(f'Adding {_format_time(start)} to {_format_time(end)}')
+        datasets.append(get_dataset(
+            trange=[_format_time(start), _format_time(end)], **kwargs))
+
+    # Later data replace earlier data with the same epoch
+    dataset = pd.concat(datasets)
+    if options['resample'] is None:
+        dataset = dataset.drop_duplicates(subset='epoch', keep='last')
+        dataset = dataset.sort_values(by='Time').reset_index(drop=True)
+    else:
+        dataset = dataset.loc[~dataset.index.duplicated(keep='last')]
+        dataset = dataset.sort_index()
+
+    metadata['trange'] = [[_format_time(s), _format_time(e)]
+                          for s, e in _merge_intervals(covered + missing)]
+
+    print(f'Storing dataset at {dataset_path}')
+    _write_dataset(dataset, dataset_path, metadata, compression)
+
+
+def _materialize_dataset(dataset_path, offline=False):
+    """
+    Extract the samples of a dataset file from the CDF files into a memory
+    mapped array store in the directory '{dataset_path}.samples'.
+
+    Each variable is stored as a .npy file, '{i}_{var_name}.npy', with one
+    row per sample in the same order as the rows of the dataset file.
+    """
+    dataset = pandas_read_file(dataset_path)
+    num_vars = len([c for c in dataset.columns if c.startswith('file ')])
+    if num_vars == 0:
+        raise ValueError('Only datasets with references to CDF files ' +
+                         'can be materialized')
+
+    files = mms.filename_to_filepath(
+        list(set().union(*[dataset[f'file {i}'].unique()
+                           for i in range(num_vars)])))
+    if not isinstance(files, list):
+        files = [files]
+
+    missing = missing_files(files, _MMS_DATA_DIR)
+    if missing and offline:
+        raise ValueError(f'{len(missing)} data files are missing ' +
+                         'and offline is set')
+    if missing:
+        print(f"{len(missing)} data files are missing, downloading")
+        mms.download_cdf_files(_MMS_DATA_DIR, missing,
+                               workers=_DOWNLOAD_WORKERS)
+
+    store_path = f'{dataset_path}.samples'
+    tmp_path = f'{store_path}.{getpid()}.tmp'
+    makedirs(tmp_path)
+
+    try:
+        for i in range(num_vars):
+            var_names = dataset[f'var_name {i}'].unique()
+            if len(var_names) != 1:
+                raise ValueError(f'Expected one variable in var_name {i}')
+            var = var_names[0]
+            epochs = dataset[f'epoch {i}'].to_numpy()
+
+            print(f'Materializing {var}')
+            store = None
+            groups = dataset.groupby(f'file {i}', sort=False, observed=True)
+            for filename, rows in groups.indices.items():
+                cdf_filepath = mms.filename_to_filepath(filename)
+                records = epoch_to_record(
+                    read_cdf_epochs(_MMS_DATA_DIR, cdf_filepath), epochs[rows])
+                values = read_cdf_file(f'{_MMS_DATA_DIR}/{cdf_filepath}',
+                                       [('var', var)], records=records)['var']
+
+                if store is None:
+                    store = open_memmap(
+                        f'{tmp_path}/{i}_{var}.npy', mode='w+',
+                        dtype=values.dtype,
+                        shape=(len(dataset),) + values.shape[1:])
+                store[rows] = values
+
+            if store is not None:
+                store.flush()
+                del store
+    except BaseException:
+        # Do not leave a partial store behind
+        rmtree(tmp_path)
+        raise
+
+    if path.isdir(store_path):
+        rmtree(store_path)
+    replace(tmp_path, store_path)
+
+
 def create_dataset(dataset_path, trange,
-                   force=False, **kwargs):
+                   force=False, append=False, compression='zstd',
+                   materialize=False, **kwargs):
     """
     Create a dataset file based on given config.
 
+    The time range and the options used are stored as metadata with the
+    dataset, in the file for feather and in '{dataset_path}.json' for CSV.
+    This allows extending the dataset later with append.
+
     Args:
-        dataset_path (string): Path to store dataset, end with either .csv or .feather.
+        dataset_path (string): Path to store dataset, end with either .csv, .feather
+            or .parquet. Parquet datasets are stored as a directory, partitioned by month.
         trange (List): List with the start and end times for the dataset. The times should
             be strings and can have either the format YYYY-mm-DD or YYYY-mm-DD/HH:MM:SS
         force (Bool): Overwrite exisiting file if one exists.
+        append (Bool): Extend an exisiting dataset with the parts of trange
+            not already covered, instead of creating a new dataset. Samples
+            with the same epoch are only stored once.
+        compression (string): The compression used for feather and Parquet
+            datasets, e.g. 'zstd', 'lz4' or 'uncompressed'. Parquet
+            also support 'snappy' and 'gzip'.
+        materialize (Bool): Also extract the samples from the CDF files into
+            a memory mapped array store, '{dataset_path}.samples', to be
+            used with MaterializedMMSData.
         **kwargs : Futher arguments, passed directy to get_dataset(..)
     """
 
@@ -383,20 +900,45 @@ def create_dataset(dataset_path, trange,
     dirpath, _ = path.split(dataset_path)
     makedirs(dirpath, exist_ok=True)
 
-    if path.isfile(dataset_path):
-        if force:
-            remove(dataset_path)
-        else:
+    trange = [_parse_time(t) for t in trange]
+    options = inspect.signature(get_dataset).bind_partial(**kwargs)
+    options.apply_defaults()
+    options = {k: options.arguments[k] for k in _METADATA_OPTIONS}
+
+    if append and force:
+        raise ValueError('Cannot both append and force')
+
+    if materialize and options['resample'] is not None:
+        raise ValueError('Resampled datasets already contain the data, ' +
+                         'and cannot be materialized')
+
+    if path.exists(dataset_path):
+        if append:
+            if kwargs.get('samples', 0) > 0:
+                raise ValueError('Cannot append to a dataset with a fixed ' +
+                                 'number of samples per label')
+            _append_dataset(dataset_path, trange, options, compression,
+                            **kwargs)
+            if materialize:
+                _materialize_dataset(dataset_path,
+                                     kwargs.get('offline', False))
+            return
+        if not force:
             print("Dataset exists, aborting")
             return
+        if path.isdir(dataset_path):
+            rmtree(dataset_path)
+        else:
+            remove(dataset_path)
+        if path.isdir(f'{dataset_path}.samples'):
+            rmtree(f'{dataset_path}.samples')
+
+    labels = get_dataset(trange=[_format_time(t) for t in trange], **kwargs)
 
-    labels = get_dataset(trange=trange, **kwargs)
+    metadata = {'trange': [[_format_time(t) for t in trange]], **options}
 
     print(f'Storing dataset at {dataset_path}')
-    _, fileformat = path.splitext(dataset_path)
-    if fileformat == '.csv':
-        labels.to_csv(dataset_path)
-    elif fileformat == '.feather':
-        labels.to_feather(dataset_path)
-    else:
-        raise ValueError(f'Unknown filetype {fileformat}')
+    _write_dataset(labels, dataset_path, metadata, compression)
+
+    if materialize:
+        _materialize_dataset(dataset_path, kwargs.get('offline', False))
@@ -2,13 +2,20 @@
 Module containing different datasets.
 """
 
+from os import path, remove
+from torch import from_numpy
 from torch.utils.data import Dataset
 
 import numpy as np
 
-from ...utils import mms, read_cdf_file, pandas_read_file
+from ...utils import mms, read_cdf_file, pandas_read_file, _filter_trange
+from ...utils.epochs import read_cdf_epochs, epoch_to_record
 from ...utils.file_download import missing_files
-from ...__init__ import _MMS_DATA_DIR
+from ...utils.cache import (LRUCache, load_shared_array, open_sample_cache,
+                            config_hash, file_hash)
+from ...utils.prefetch import Prefetcher
+from ...utils.verify import verify_cdf_files
+from ...__init__ import _MMS_DATA_DIR, _DOWNLOAD_WORKERS, __version__
 
 
 class ExternalMMSData(Dataset):
@@ -38,7 +45,8 @@ class ExternalMMSData(Dataset):
 
     Warning:
         If loading data fail it may be due to the cdf file being corrupt.
-        Delete the failing file and retry.
+        Use verify=True to check the files, and re-download corrupt files,
+        before the dataset is used.
 
     Examples:
         >>> from spacephyml.datasets.general import ExternalMMSData
@@ -55,14 +63,66 @@ class ExternalMMSData(Dataset):
             If data should be cached.
         return_epoch (bool):
             If the label epoch should be returned.
-
-
+        trange (list):
+            Only load samples inside the time range, with the format
+            [start, end].
+        cache_size (int):
+            The largest size, in bytes, of the cached data. The least
+            recently used files are evicted first. None for no limit.
+        cache_pinned (int):
+            The number of files, the ones used by the most samples, to keep
+            in the cache regardless of cache_size.
+        shared_cache (bool or string):
+            Share the decoded data between processes, e.g. the workers of a
+            torch DataLoader. Each varible is decoded once and stored in a
+            scratch file, which all processes memory map. Either a
+            directory for the scratch files or True to use
+            '{rootdir}/.shared_cache'.
+        prefetch (int):
+            The number of data files to read ahead in a background thread,
+            following the order of the files in the dataset file. Hides the
+            time spent reading files when iterating the dataset in order.
+            Requires cache to be enabled.
+        verify (bool):
+            Verify the data files when the dataset is loaded, corrupt or
+            truncated files are downloaded again. Verified files are
+            recorded in a manifest in rootdir, so unchanged files are only
+            verified once.
+        transform_cache (bool or string):
+            Store the transformed samples in a memory mapped array, so the
+            samples are only read and transformed once, also across runs.
+            The store is keyed by the path, size and modification time of
+            the dataset file, the time range, the transform (its class and
+            attributes)
+            and the SpacePhyML version, a new store is used if any of them
+            change. Either a directory for the stores or True to use
+            '{rootdir}/.transform_cache'.
+
+    The cache hit, miss and eviction counters are available with
+    `dataset.data.stats()`.
+
+    The dataset table is kept as typed arrays, with the data files coded as
+    integers, and the full table is only read from the dataset file when
+    `dataset.dataset` is first used.
     """
 
     def __init__(self, dataset_path, rootdir=None, transform=None, cache=True,
-                 return_epoch=True):
+                 return_epoch=True, trange=None, cache_size=None,
+                 cache_pinned=0, shared_cache=False, prefetch=0,
+                 verify=False, transform_cache=False):
+
+        if prefetch > 0 and not cache:
+            raise ValueError('Prefetching requires cache to be enabled')
+
+        # The table is only kept as the typed arrays below, the full table is
+        # available through the dataset property.
+        self.dataset_path = dataset_path
+        self.trange = trange
+        self._dataset = None
+        table = pandas_read_file(
+            dataset_path, trange=trange,
+            categorical=lambda c: c.startswith(('file ', 'var_name ')))
 
-        self.dataset = pandas_read_file(dataset_path)
         self.cache = cache
         self.return_epoch = return_epoch
 
@@ -71,13 +131,26 @@ class ExternalMMSData(Dataset):
         else:
             self.rootdir = _MMS_DATA_DIR
 
-        # There are two extra columns and for each varible
-        # there are three columns
-        self.num_vars = int((len(self.dataset.columns)-2)/3)
+        self.shared_cache = shared_cache
+        if shared_cache is True:
+            self.shared_cache = f'{self.rootdir}/.shared_cache'
+
+        self.length = len(table.index)
+        self.num_vars = len([c for c in table.columns
+                             if c.startswith('file ')])
 
+        # For each varible, the (file name, varible name) pairs to read from,
+        # in the order they first appear, and for each sample the index of
+        # the pair and the record to read.
+        self.files = []
+        self.file_codes = []
+        self.records = []
         for i in range(self.num_vars):
+            groups = table.groupby([f'file {i}', f'var_name {i}'],
+                                   sort=False, observed=True)
+
             files = mms.filename_to_filepath(
-                self.dataset[f'file {i}'].unique())
+                list(table[f'file {i}'].unique()))
 
             if not isinstance(files, list):
                 files = [files]
@@ -86,21 +159,149 @@ class ExternalMMSData(Dataset):
 
             if missing:
                 print(f"{len(missing)} data files are missing, downloading")
-                mms.download_cdf_files(self.rootdir, missing)
-
-            if self.cache:
-                # Add an index for each entry
-                self.dataset[f'index {i}'] = -1
-
-        self.length = len(self.dataset.index)
+                mms.download_cdf_files(self.rootdir, missing,
+                                       workers=_DOWNLOAD_WORKERS)
+
+            if verify:
+                self._verify_files([key for key in groups.indices])
+
+            epochs = table[f'epoch {i}'].to_numpy()
+            file_codes = np.zeros(self.length, dtype=np.int32)
+            records = np.zeros(self.length, dtype=np.int64)
+            for code, (key, rows) in enumerate(groups.indices.items()):
+                file_codes[rows] = code
+                records[rows] = epoch_to_record(
+                    read_cdf_epochs(self.rootdir,
+                                    mms.filename_to_filepath(key[0])),
+                    epochs[rows])
+
+            self.files.append(list(groups.indices.keys()))
+            self.file_codes.append(file_codes)
+            self.records.append(records)
+
+        self.labels = table['label'].to_numpy()
+        self.epochs = table['epoch'].to_numpy()
+        del table
 
         self.transform = transform
 
-        self.data = {}
+        self.data = LRUCache(cache_size)
+        if cache_pinned > 0:
+            # Pin the files used by the most samples
+            usage = [(count, files[code])
+                     for files, file_codes in zip(self.files, self.file_codes)
+                     for code, count in enumerate(
+                         np.bincount(file_codes, minlength=len(files)))]
+            for _, key in sorted(usage, reverse=True)[:cache_pinned]:
+                self.data.pin(key)
+
+        self.prefetch = prefetch
+        self.prefetchers = [Prefetcher(self._read_file, prefetch)
+                            for _ in range(self.num_vars)] if prefetch else []
+
+        self.transformed = None
+        if transform_cache and transform is not None and self.length > 0:
+            if transform_cache is True:
+                transform_cache = f'{self.rootdir}/.transform_cache'
+            key = config_hash(file_hash(dataset_path), trange, transform,
+                              __version__)
+            self._cached_transform = transform
+            (self.transformed, self.transformed_stored,
+             self._transform_tensor) = open_sample_cache(
+                 transform_cache, key, self.length,
+                 lambda: self._transform_batch(np.zeros(1, dtype=np.int64))[0])
+
+    def _verify_files(self, files):
+        """
+        Verify the (file name, varible name) pairs, downloading corrupt files
+        again.
+        """
+        variables = {}
+        for filename, var in files:
+            variables.setdefault(mms.filename_to_filepath(filename),
+                                 []).append(var)
+        files = variables
+
+        corrupt = verify_cdf_files(self.rootdir, files,
+                                   workers=_DOWNLOAD_WORKERS)
+        if not corrupt:
+            return
+
+        for filepath, problem in corrupt.items():
+            print(f'Corrupt data file {filepath}: {problem}')
+            remove(f'{self.rootdir}/{filepath}')
+
+        print(f"{len(corrupt)} data files are corrupt, downloading")
+        mms.download_cdf_files(self.rootdir, list(corrupt),
+                               workers=_DOWNLOAD_WORKERS)
+
+        corrupt = verify_cdf_files(self.rootdir,
+                                   {f: files[f] for f in corrupt},
+                                   workers=_DOWNLOAD_WORKERS)
+        if corrupt:
+            raise ValueError('Data files are corrupt after downloading: ' +
+                             ', '.join(corrupt))
+
+    @property
+    def dataset(self):
+        """
+        The full dataset table, read from the dataset file when first used.
+        """
+        if self._dataset is None:
+            self._dataset = pandas_read_file(self.dataset_path,
+                                             trange=self.trange)
+        return self._dataset
 
     def __len__(self):
         return self.length
 
+    def _read_file(self, key):
+        """
+        Read a whole varible from a CDF file, through the shared cache if
+        enabled.
+        """
+        filename, var = key
+        cdf_filepath = mms.filename_to_filepath(filename)
+        cdf_filepath = f'{self.rootdir}/{cdf_filepath}'
+        if self.shared_cache:
+            return load_shared_array(
+                self.shared_cache, cdf_filepath, var,
+                lambda: read_cdf_file(cdf_filepath, [('var', var)])['var'])
+        return read_cdf_file(cdf_filepath, [('var', var)])['var']
+
+    def _read_var(self, i, code, records):
+        """
+        Read records of varible i from the file with the given code. The
+        whole varible is read and cached if caching is enabled, otherwise
+        only the records are read.
+        """
+        key = self.files[i][code]
+        if not self.cache and not self.shared_cache:
+            filename, var = key
+            cdf_filepath = mms.filename_to_filepath(filename)
+            return read_cdf_file(f'{self.rootdir}/{cdf_filepath}',
+                                 [('var', var)], records=records)['var']
+
+        data = self.data.get(key) if self.cache else None
+        if data is not None:
+            return data[records]
+
+        if self.prefetch:
+            data = self.prefetchers[i].get(key)
+            # Read ahead the next files, that are not already cached
+            upcoming = self.files[i][code + 1:code + 1 + self.prefetch]
+            self.prefetchers[i].request(
+                [k for k in upcoming if k not in self.data])
+        if data is None:
+            data = self._read_file(key)
+
+        if self.cache:
+            self.data.put(key, data)
+
+        # Indexing with an array copies the records, so the cached data is
+        # not changed by transforms.
+        return data[records]
+
     def __getitem__(self, idx):
         """
         Returns:
@@ -112,45 +313,231 @@ class ExternalMMSData(Dataset):
         if not isinstance(idx, int):
             raise ValueError('Expected idx to be an integer value')
 
-        data_loc = self.dataset.iloc[idx]
+        if self.transformed is not None:
+            return self.__getitems__([idx])[0]
 
         sample = []
         for i in range(self.num_vars):
-            cdf_filepath = mms.filename_to_filepath(data_loc[f'file {i}'])
-            cdf_filepath = f'{self.rootdir}/{cdf_filepath}'
-
-            data = {}
-            if self.cache:
-                if not data_loc[f'file {i}'] in self.data:
-                    self.data[data_loc[f'file {i}']] = \
-                        read_cdf_file(cdf_filepath,
-                                      [('var', data_loc[f'var_name {i}']),
-                                       ('epoch', 'epoch')])
-
-                # This index caching does not seem to work
-                index = data_loc[f'index {i}']
-                if index == -1:
-                    self.dataset.at[idx, f'index {i}'] =  \
-                        np.where(self.data[data_loc[f'file {i}']]['epoch'] ==
-                                 data_loc[f'epoch {i}'])[0]
-                    index = self.dataset.loc[idx, f'index {i}']
-
-                sample.append(self.data[data_loc[f'file {i}']]['var'][index])
-            else:
-                data = read_cdf_file(cdf_filepath,
-                                     [('var', data_loc[f'var_name {i}']),
-                                      ('epoch', 'epoch')])
-
-                index = np.where(
-                        data['epoch'] == data_loc[f'epoch {i}'])
-                sample.append(self.data[data_loc[f'file {i}']]['var'][index])
+            sample.append(self._read_var(i, self.file_codes[i][idx],
+                                         self.records[i][[idx]])[0])
 
         if self.transform:
             sample[0] = self.transform(sample[0])
 
-        sample.append(data_loc.label)
+        sample.append(self.labels[idx])
 
         if self.return_epoch:
-            sample.append(data_loc.epoch)
+            sample.append(self.epochs[idx])
 
         return sample
+
+    def _gather(self, i, indices):
+        """
+        Gather varible i for a batch of samples, reading each file once.
+        """
+        codes = self.file_codes[i][indices]
+        records = self.records[i][indices]
+
+        batch = None
+        for code in np.unique(codes):
+            rows = np.flatnonzero(codes == code)
+            data = self._read_var(i, code, records[rows])
+            if batch is None:
+                batch = np.empty((len(indices),) + data.shape[1:],
+                                 dtype=data.dtype)
+            batch[rows] = data
+
+        return batch
+
+    def _transform_batch(self, indices):
+        """
+        Gather varible 0 for a batch of samples and apply the transform.
+        """
+        data = self._gather(0, indices)
+        if self.transform and getattr(self.transform, 'batchable', False):
+            return self.transform(data)
+        if self.transform:
+            return [self.transform(x) for x in data]
+        return data
+
+    def _transformed(self, indices):
+        """
+        Get the transformed varible 0 for a batch of samples, from the
+        transform cache if enabled.
+        """
+        if self.transformed is None or \
+                self.transform is not self._cached_transform:
+            return self._transform_batch(indices)
+
+        stored = self.transformed_stored[indices] != 0
+        batch = [None] * len(indices)
+
+        todo = np.flatnonzero(~stored)
+        if len(todo) > 0:
+            for j, x in zip(todo, self._transform_batch(indices[todo])):
+                self.transformed[indices[j]] = np.asarray(x)
+                self.transformed_stored[indices[j]] = 1
+                batch[j] = x
+
+        for j in np.flatnonzero(stored):
+            x = np.array(self.transformed[indices[j]])
+            batch[j] = from_numpy(x) if self._transform_tensor else x
+
+        return batch
+
+    def __getitems__(self, indices):
+        """
+        Get a batch of samples, used by the torch DataLoader.
+
+        The samples are grouped by file and the records of each file are
+        read with one operation. If the transform is batchable it is applied
+        once to the whole batch. With the transform cache, only the samples
+        not already in the cache are read and transformed.
+
+        Returns:
+            (list):
+                A list with one sample, as returned by __getitem__, for each
+                index.
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        if len(indices) == 0:
+            return []
+
+        batch = [self._transformed(indices)]
+        batch += [self._gather(i, indices) for i in range(1, self.num_vars)]
+
+        samples = []
+        for j, idx in enumerate(indices):
+            sample = [data[j] for data in batch]
+            sample.append(self.labels[idx])
+            if self.return_epoch:
+                sample.append(self.epochs[idx])
+            samples.append(sample)
+
+        return samples
+
+
+class MaterializedMMSData(Dataset):
+    """
+    Loading a dataset with MMS data from a materialized sample store.
+
+    The sample store is created with `create_dataset(..., materialize=True)`
+    and is stored next to the dataset file, in '{dataset_path}.samples'. It
+    contains one memory mapped array per variable, so samples are read
+    directly from disk (or the page cache) without decoding any CDF files.
+    Batches of samples, from `__getitems__`, are read with one operation
+    per variable.
+
+    The dataset file have the same columns as for ExternalMMSData.
+
+    Examples:
+        >>> from spacephyml.datasets.general import MaterializedMMSData
+        >>> dataset = MaterializedMMSData('./mydataset.feather')
+
+    Args:
+        dataset_path (string):
+            Path to the file containing the dataset.
+        transform (callable):
+            Optional transform to be applied on each sample.
+        return_epoch (bool):
+            If the label epoch should be returned.
+        trange (list):
+            Only load samples inside the time range, with the format
+            [start, end].
+    """
+
+    def __init__(self, dataset_path, transform=None, return_epoch=True,
+                 trange=None):
+
+        self.dataset = pandas_read_file(dataset_path)
+        self.return_epoch = return_epoch
+        self.transform = transform
+
+        store_path = f'{dataset_path}.samples'
+        if not path.isdir(store_path):
+            raise ValueError(f'No sample store found at {store_path}')
+
+        self.num_vars = len([c for c in self.dataset.columns
+                             if c.startswith('file ')])
+
+        self.samples = []
+        for i in range(self.num_vars):
+            var = self.dataset[f'var_name {i}'].iloc[0]
+            self.samples.append(np.load(f'{store_path}/{i}_{var}.npy',
+                                        mmap_mode='r'))
+
+        for samples in self.samples:
+            if len(samples) != len(self.dataset.index):
+                raise ValueError('The sample store does not match the dataset')
+
+        # The rows of the store to use, the dataset index is the row number
+        self.rows = self.dataset.index.to_numpy()
+        if trange is not None:
+            self.rows = _filter_trange(self.dataset, trange).index.to_numpy()
+
+        self.labels = self.dataset['label'].to_numpy()
+        self.epochs = self.dataset['epoch'].to_numpy()
+        self.length = len(self.rows)
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, idx):
+        """
+        Returns:
+            (typle):
+                Will return a list with with all the data varibles in a list
+                followed by the label. If 'return_epoch = True' is set the
+                label epoch of the data will also be returned.
+        """
+        if not isinstance(idx, int):
+            raise ValueError('Expected idx to be an integer value')
+
+        row = self.rows[idx]
+
+        # Copy the samples out of the read-only store, so they can be
+        # modified by the transform.
+        sample = [np.array(samples[row]) if samples.ndim > 1 else samples[row]
+                  for samples in self.samples]
+
+        if self.transform:
+            sample[0] = self.transform(sample[0])
+
+        sample.append(self.labels[row])
+
+        if self.return_epoch:
+            sample.append(self.epochs[row])
+
+        return sample
+
+    def __getitems__(self, indices):
+        """
+        Get a batch of samples, used by the torch DataLoader.
+
+        The records of each varible are read with one operation. If the
+        transform is batchable it is applied once to the whole batch.
+
+        Returns:
+            (list):
+                A list with one sample, as returned by __getitem__, for each
+                index.
+        """
+        rows = self.rows[np.asarray(indices, dtype=np.int64)]
+        if len(rows) == 0:
+            return []
+
+        batch = [samples[rows] for samples in self.samples]
+        if self.transform and getattr(self.transform, 'batchable', False):
+            batch[0] = self.transform(batch[0])
+        elif self.transform:
+            batch[0] = [self.transform(x) for x in batch[0]]
+
+        samples = []
+        for j, row in enumerate(rows):
+            sample = [data[j] for data in batch]
+            sample.append(self.labels[row])
+            if self.return_epoch:
+                sample.append(self.epochs[row])
+            samples.append(sample)
+
+        return samples
@@ -10,7 +10,7 @@ from ...utils import pandas_read_file
 
 class PandasDataset(Dataset):
     """
-    Loading a dataset contained within a .csv or .feather file.
+    Loading a dataset contained within a .csv, .feather or .parquet file.
 
     The dataset file have to have the following columns:
 
@@ -27,6 +27,8 @@ class PandasDataset(Dataset):
             data sample.
         data_columns (list): Which columns to use for data.
         label_column (string): Which column to use for label.
+        trange (list): Only load samples inside the time range, with the
+            format [start, end].
 
     Returns:
         Will return a list with with all the data varibles in a list followed
@@ -34,9 +36,16 @@ class PandasDataset(Dataset):
     """
 
     def __init__(self, dataset_path, transform=None, data_columns=None,
-                 label_column=None, return_index=True):
+                 label_column=None, return_index=True, trange=None):
 
-        self.dataset = pandas_read_file(dataset_path)
+        columns = None
+        if data_columns is not None:
+            columns = list(data_columns)
+            if label_column is not None:
+                columns.append(label_column)
+
+        self.dataset = pandas_read_file(dataset_path, columns=columns,
+                                        trange=trange)
         self.label_column = label_column
         self.return_index = return_index
 
@@ -43,7 +43,8 @@ class MMS1IonDistLabeled(ExternalMMSData):
                 }}
 
     def __init__(self, dataset, path='./datasets', data_root=None,
-                 transform=None, cache=True, return_epoch = False):
+                 transform=None, cache=True, return_epoch = False,
+                 transform_cache=False):
         """
 
         Args:
@@ -60,6 +61,8 @@ class MMS1IonDistLabeled(ExternalMMSData):
                 If data should be cached.
             return_epoch (bool):
                 If the label epoch should be returned.
+            transform_cache (bool or string):
+                Store the transformed samples, see ExternalMMSData.
         """
         if dataset not in self._valid_datasets:
             raise ValueError(f'Incorrect dataset, {dataset} not in' +
@@ -76,4 +79,5 @@ class MMS1IonDistLabeled(ExternalMMSData):
         if transform is None:
             transform = IonDist_Transform()
 
-        super().__init__(filepath, data_root, transform, cache, return_epoch)
+        super().__init__(filepath, data_root, transform, cache, return_epoch,
+                         transform_cache=transform_cache)
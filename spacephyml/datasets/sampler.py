@@ -0,0 +1,148 @@
+"""
+Samplers for datasets reading from data files.
+"""
+import numpy as np
+import pandas as pd
+from torch.utils.data import Sampler
+
+
+class FileLocalitySampler(Sampler):
+    """
+    Shuffle the samples of a dataset while only reading from a few data files
+    at the time.
+
+    The order of the data files is shuffled and the files are split into
+    windows of `window` files. The samples within each window are shuffled
+    together, so only the files of one window are needed at any time, e.g.
+    in the cache of ExternalMMSData.
+
+    For distributed training the files are split between the replicas, so
+    each replica reads a disjoint set of files (if there are fewer files
+    than replicas the largest files are split). The files are assigned to
+    balance the number of samples, and each replica gets the same number of
+    samples by repeating samples on the replicas with fewer samples (or
+    dropping samples on the replicas with more if drop_last is set).
+
+    Examples:
+        >>> from torch.utils.data import DataLoader
+        >>> from spacephyml.datasets.general.mms import ExternalMMSData
+        >>> from spacephyml.datasets.sampler import FileLocalitySampler
+        >>> dataset = ExternalMMSData('./mydataset.csv')
+        >>> sampler = FileLocalitySampler(dataset, window=4, seed=0)
+        >>> loader = DataLoader(dataset, batch_size=32, sampler=sampler)
+
+    Args:
+        dataset (Dataset): The dataset to sample, either ExternalMMSData or
+            a dataset with the dataset table (with the 'file {i}' columns) in
+            dataset.dataset.
+        window (int): The number of files to shuffle the samples within.
+        seed (int): Seed for the shuffling, the same on all replicas.
+        num_replicas (int): The number of distributed replicas, by default
+            the world size if torch.distributed is initialized and else 1.
+        rank (int): The rank of this replica.
+        file_column (string): The column with the data file of each sample.
+        drop_last (bool): Drop samples instead of repeating samples to give
+            each replica the same number of samples.
+    """
+
+    def __init__(self, dataset, window=8, seed=0, num_replicas=None,
+                 rank=None, file_column='file 0', drop_last=False):
+        if num_replicas is None or rank is None:
+            # pylint: disable=import-outside-toplevel
+            import torch.distributed as dist
+            initialized = dist.is_available() and dist.is_initialized()
+            if num_replicas is None:
+                num_replicas = dist.get_world_size() if initialized else 1
+            if rank is None:
+                rank = dist.get_rank() if initialized else 0
+
+        if window < 1:
+            raise ValueError(f'Invalid window {window}, has to be at least 1')
+        if not 0 <= rank < num_replicas:
+            raise ValueError(f'Invalid rank {rank}, has to be in the ' +
+                             f'range [0, {num_replicas - 1}]')
+
+        self.window = window
+        self.seed = seed
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.drop_last = drop_last
+        self.epoch = 0
+
+        if hasattr(dataset, 'file_codes') and file_column.startswith('file '):
+            # The data files are already coded by ExternalMMSData
+            file_codes = dataset.file_codes[int(file_column[5:])]
+        else:
+            file_codes, _ = pd.factorize(dataset.dataset[file_column])
+        # The samples of each file, in the order of the file codes
+        order = np.argsort(file_codes, kind='stable')
+        counts = np.bincount(file_codes)
+        self.file_samples = np.split(order, np.cumsum(counts)[:-1])
+
+        if len(order) == 0:
+            # Nothing to sample
+            self.file_samples = []
+            return
+        if len(order) < num_replicas:
+            raise ValueError(f'Not enough samples ({len(order)}) for ' +
+                             f'{num_replicas} replicas')
+
+        # Split the largest files until each replica can get one part
+        while len(self.file_samples) < num_replicas:
+            largest = max(range(len(self.file_samples)),
+                          key=lambda f: len(self.file_samples[f]))
+            self.file_samples[largest:largest + 1] = np.array_split(
+                self.file_samples[largest], 2)
+
+    def set_epoch(self, epoch):
+        """
+        Set the epoch, giving a different order for each epoch.
+
+        Args:
+            epoch (int): The epoch number.
+        """
+        self.epoch = epoch
+
+    def _rank_files(self, rng):
+        """
+        Shuffle the files and split them between the replicas, balancing
+        the number of samples.
+
+        Returns:
+            Tuple with the files of this replica and the number of samples
+            each replica should return.
+        """
+        files = rng.permutation(len(self.file_samples))
+
+        counts = np.zeros(self.num_replicas, dtype=np.int64)
+        rank_files = []
+        for file in files:
+            rank = np.argmin(counts)
+            counts[rank] += len(self.file_samples[file])
+            if rank == self.rank:
+                rank_files.append(file)
+
+        num_samples = counts.min() if self.drop_last else counts.max()
+        return np.array(rank_files, dtype=np.int64), int(num_samples)
+
+    def __iter__(self):
+        rng = np.random.default_rng([self.seed, self.epoch])
+
+        files, num_samples = self._rank_files(rng)
+        indices = []
+        for start in range(0, len(files), self.window):
+            window = [self.file_samples[f]
+                      for f in files[start:start + self.window]]
+            indices.append(rng.permutation(np.concatenate(window)))
+
+        indices = np.concatenate(indices) if indices else \
+            np.zeros(0, dtype=np.int64)
+        if 0 < len(indices) < num_samples:
+            indices = np.resize(indices, num_samples)
+
+        return iter(indices[:num_samples].tolist())
+
+    def __len__(self):
+        _, num_samples = self._rank_files(
+            np.random.default_rng([self.seed, self.epoch]))
+        return num_samples
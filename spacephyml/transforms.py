@@ -1,8 +1,96 @@
 """
 Different useful transforms.
+
+Transforms with `batchable = True` give the same result when applied to a
+batch of samples, stacked along a new first axis, as when applied to each
+sample. The batchable transforms can also be applied to torch tensors,
+e.g. to a collated batch with BatchCollate.
 """
 import numpy as np
+import torch
 from torch import unsqueeze, from_numpy
+from torch.utils.data import DataLoader, IterableDataset, default_collate, \
+    get_worker_info
+
+from .utils.stats import RunningStats
+
+
+class _PartialStats(IterableDataset):
+    """
+    Statistics of the data (the first element of the samples) of a dataset,
+    each DataLoader worker accumulating the statistics of one contiguous
+    part of the dataset.
+    """
+    def __init__(self, dataset, channel_axis, log, batch_size):
+        self.dataset = dataset
+        self.channel_axis = channel_axis
+        self.log = log
+        self.batch_size = batch_size
+
+    def _batch(self, indices):
+        if hasattr(self.dataset, '__getitems__'):
+            samples = self.dataset.__getitems__(indices)
+        else:
+            samples = [self.dataset[i] for i in indices]
+        return default_collate(samples)
+
+    def __iter__(self):
+        indices = np.arange(len(self.dataset))
+        worker = get_worker_info()
+        if worker is not None:
+            indices = np.array_split(indices, worker.num_workers)[worker.id]
+
+        stats = RunningStats(self.channel_axis)
+        dtype = None
+        for start in range(0, len(indices), self.batch_size):
+            batch = self._batch(
+                indices[start:start + self.batch_size].tolist())
+            if isinstance(batch, (list, tuple)):
+                batch = batch[0]
+            data = np.asarray(batch)
+            dtype = data.dtype if data.dtype.kind == 'f' else np.float32
+            if self.log:
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    data = np.log10(data)
+            stats.update(data)
+
+        yield stats, dtype
+
+
+def _fit_stats(dataset, channel_axis, log, batch_size, num_workers):
+    """
+    Compute the statistics of the data (the first element of the samples)
+    of a dataset in one pass. The statistics of the parts of the dataset
+    read by each worker are computed in the workers, and merged.
+
+    Returns:
+        Tuple with the statistics and a function casting a statistic to the
+        data type of the data (float32 for integer data), so the fitted
+        transforms keep the data type of the samples.
+    """
+    stats = RunningStats(channel_axis)
+    dtype = None
+    loader = DataLoader(_PartialStats(dataset, channel_axis, log, batch_size),
+                        batch_size=None, num_workers=num_workers)
+    for partial, partial_dtype in loader:
+        stats.merge(partial)
+        if partial_dtype is not None:
+            dtype = partial_dtype
+
+    def cast(value):
+        # Python floats do not change the data type of arrays
+        if isinstance(value, float):
+            return value
+        return np.asarray(value, dtype=dtype)
+
+    return stats, cast
+
+
+def _torch_dtype(dtype):
+    """
+    Get the torch data type corresponding to a numpy data type.
+    """
+    return from_numpy(np.empty(0, dtype=dtype)).dtype
 
 
 class Compose():
@@ -19,36 +107,188 @@ class Compose():
     def __init__(self, *transforms):
         self.transforms = transforms
 
+    @property
+    def batchable(self):
+        """
+        If all the composed transforms can be applied to a batch.
+        """
+        return all(getattr(trans, 'batchable', False)
+                   for trans in self.transforms)
+
     def __call__(self, sample):
         for trans in self.transforms:
             sample = trans(sample)
 
         return sample
 
+    def compile(self):
+        """
+        Fuse the transforms into fewer steps, giving the same result (up to
+        rounding, as a roll followed by a sum along the same axis is not
+        done).
+
+        Consecutive elementwise transforms (Threshold, ClipLogNorm, LogNorm,
+        Log10 and ZScoreNorm) are applied as one step, working in place on
+        one buffer. A Roll is done with precomputed indices, after any
+        following Sum or Mean (or not at all if the sum is along the rolled
+        axis). Nested Compose transforms are compiled as well, and other
+        transforms are called as before.
+
+        Like Threshold, the compiled transform may modify the sample in
+        place.
+
+        Returns:
+            A Compose with the fused transforms.
+        """
+        transforms = []
+        for trans in self.transforms:
+            if isinstance(trans, Compose):
+                transforms.extend(trans.compile().transforms)
+            else:
+                transforms.append(trans)
+
+        return Compose(*_fuse(transforms))
+
 class IonDist_Transform(Compose):
     """
     The default transform used in MMS1IonDistLabeled.
 
     Args:
         norm (tuple): The values to threshold and calculate LogNorm with.
+        dtype (dtype): The data type of the output, by default the data type
+            of the sample.
 
     """
-    def __init__(self, norm = (-28, -17)):
-        super().__init__(Threshold((np.power(10.0, norm[0]),
-                                    np.power(10.0, norm[1]))),
-                         LogNorm(norm),
+    def __init__(self, norm = (-28, -17), dtype=None):
+        super().__init__(ClipLogNorm(norm, dtype=dtype),
                          Roll(),
-                         lambda x: unsqueeze(from_numpy(x), 0))
+                         ToTensor(dim=-4))
+
+
+class ToTensor():
+    """
+    Convert the sample to a torch tensor, optionally adding a dimension.
+
+    Args:
+        dim (int): Where to add a dimension of size one, or None to not add
+            a dimension. Use a negative value for it to work on batches.
+    """
+    def __init__(self, dim=None):
+        self.dim = dim
+
+    @property
+    def batchable(self):
+        """
+        Only a negative dim can be used for a batch.
+        """
+        return self.dim is None or self.dim < 0
+
+    def __call__(self, sample):
+        x = sample
+        if not isinstance(x, torch.Tensor):
+            x = from_numpy(np.asarray(sample))
+        if self.dim is not None:
+            x = unsqueeze(x, self.dim)
+        return x
+
+
+class BatchCollate():
+    """
+    Collate function for a torch DataLoader, applying a transform once to
+    the collated batch of data, as a torch tensor, instead of to each
+    sample. The transform has to be batchable.
+
+    The transform runs in the process collating the batch, and uses the
+    torch intra-op thread pool (see torch.set_num_threads).
+
+    Examples:
+        >>> from torch.utils.data import DataLoader
+        >>> import spacephyml.transforms as tf
+        >>> collate_fn = tf.BatchCollate(tf.IonDist_Transform())
+        >>> loader = DataLoader(dataset, batch_size=256,
+        ...                     collate_fn=collate_fn)
+
+    Args:
+        transform (callable): The batchable transform to apply to the data,
+            the first element of each sample.
+        collate (callable): The function collating the samples.
+    """
+    def __init__(self, transform, collate=default_collate):
+        if not getattr(transform, 'batchable', False):
+            raise ValueError('The transform can not be applied to a batch')
+
+        self.transform = transform
+        self.collate = collate
+
+    def __call__(self, samples):
+        batch = self.collate(samples)
+        batch[0] = self.transform(batch[0])
+        return batch
+
+
+def batch_mode(dataset):
+    """
+    Move the transform of a dataset to a collate function, so it is applied
+    once per batch by the DataLoader.
+
+    Examples:
+        >>> from torch.utils.data import DataLoader
+        >>> from spacephyml.transforms import batch_mode
+        >>> loader = DataLoader(dataset, batch_size=256,
+        ...                     collate_fn=batch_mode(dataset))
+
+    Args:
+        dataset (Dataset): The dataset, with the transform in
+            dataset.transform.
+
+    Returns:
+        A BatchCollate applying the transform of the dataset.
+    """
+    collate = BatchCollate(dataset.transform)
+    dataset.transform = None
+    return collate
 
 
 class ZScoreNorm():
     """
     Calculate the Z-Score norm using specified mean and std.
+
+    The mean and std can be computed from a dataset with ZScoreNorm.fit.
     """
+    batchable = True
+
     def __init__(self, mean, std):
         self.mean = mean
         self.std = std
 
+    @classmethod
+    def fit(cls, dataset, channel_axis=None, batch_size=256, num_workers=0):
+        """
+        Create a ZScoreNorm with the mean and std of a dataset, computed in
+        one streaming pass so the dataset does not have to fit in memory.
+
+        Examples:
+            >>> from spacephyml.transforms import ZScoreNorm
+            >>> norm = ZScoreNorm.fit(dataset, channel_axis=-1)
+
+        Args:
+            dataset (Dataset): The dataset, the statistics are computed for
+                the first element of the samples (after the transform of
+                the dataset, if any).
+            channel_axis (int): Compute the statistics per channel along
+                this (negative) axis of the samples, None for global
+                statistics.
+            batch_size (int): The number of samples to load at the time.
+            num_workers (int): The number of DataLoader workers, each
+                loading a part of the dataset and computing its statistics.
+
+        Returns:
+            The fitted ZScoreNorm.
+        """
+        stats, cast = _fit_stats(dataset, channel_axis, False, batch_size,
+                                 num_workers)
+        return cls(cast(stats.mean), cast(stats.std))
+
     def __call__(self, sample):
         return ((sample - self.mean)/self.std)
 
@@ -57,12 +297,18 @@ class Threshold():
     """
     Threshold the sample.
     """
+    batchable = True
+
     def __init__(self, thresholds):
         self.thresholds = thresholds
 
     def __call__(self, sample):
         x = sample
 
+        if isinstance(x, torch.Tensor):
+            return x.clamp_(float(self.thresholds[0]),
+                            float(self.thresholds[1]))
+
         threshold_low_index = np.where(x < self.thresholds[0])
         x[threshold_low_index] = self.thresholds[0]
 
@@ -75,12 +321,53 @@ class Threshold():
 class LogNorm():
     """
     Log Normalize the data between a given range
+
+    Without a normalization each sample is normalized by its own range, use
+    LogNorm.fit to get the range of a dataset.
     """
     def __init__(self, normalization=None):
         self.normalization = normalization
 
+    @classmethod
+    def fit(cls, dataset, channel_axis=None, batch_size=256, num_workers=0):
+        """
+        Create a LogNorm normalizing with the range of the log10 values of a
+        dataset, computed in one streaming pass. Values that are zero (or
+        negative) are skipped.
+
+        Examples:
+            >>> from spacephyml.transforms import LogNorm
+            >>> norm = LogNorm.fit(dataset)
+
+        Args:
+            dataset (Dataset): The dataset, the range is computed for the
+                first element of the samples (after the transform of the
+                dataset, if any).
+            channel_axis (int): Compute the range per channel along this
+                (negative) axis of the samples, None for a global range.
+            batch_size (int): The number of samples to load at the time.
+            num_workers (int): The number of DataLoader workers, each
+                loading a part of the dataset and computing its statistics.
+
+        Returns:
+            The fitted LogNorm.
+        """
+        stats, cast = _fit_stats(dataset, channel_axis, True, batch_size,
+                                 num_workers)
+        return cls((cast(stats.min), cast(stats.max)))
+
+    @property
+    def batchable(self):
+        """
+        Only a fixed normalization can be applied to a batch.
+        """
+        return self.normalization is not None
+
     def __call__(self, sample):
-        x = np.log10(sample)
+        if isinstance(sample, torch.Tensor):
+            x = torch.log10(sample)
+        else:
+            x = np.log10(sample)
 
         if self.normalization is None:
             x -= x.min()
@@ -92,6 +379,66 @@ class LogNorm():
         return x
 
 
+class ClipLogNorm():
+    """
+    Threshold the sample to [10^norm[0], 10^norm[1]] and log normalize it,
+    the same as Threshold followed by LogNorm(norm), in one pass.
+
+    The sample is modified in place when it has the output data type,
+    otherwise (or if out is given) the result is written to a new (or the
+    given) array.
+
+    Examples:
+        >>> import numpy as np
+        >>> import spacephyml.transforms as tf
+        >>> transform = tf.ClipLogNorm((-28, -17), dtype=np.float32)
+        >>> out = np.empty((32, 32, 16), dtype=np.float32)
+        >>> transform(sample, out=out)
+
+    Args:
+        normalization (tuple): The log10 of the lower and upper thresholds.
+        dtype (dtype): The data type of the output, by default the data type
+            of the sample.
+    """
+    batchable = True
+
+    def __init__(self, normalization=(-28, -17), dtype=None):
+        self.normalization = normalization
+        self.dtype = dtype
+
+    def __call__(self, sample, out=None):
+        low, high = self.normalization
+        if isinstance(sample, torch.Tensor):
+            x = sample
+            if self.dtype is not None:
+                x = x.to(_torch_dtype(self.dtype))
+            elif not x.is_floating_point():
+                x = x.double()
+            if out is None:
+                out = x
+            torch.clamp(x, 10.0 ** low, 10.0 ** high, out=out)
+            return out.log10_().sub_(low).div_(high - low)
+
+        x = np.asarray(sample)
+
+        if out is None:
+            dtype = self.dtype
+            if dtype is None:
+                dtype = x.dtype if x.dtype.kind == 'f' else np.float64
+
+            if x.dtype == dtype and x.flags.writeable:
+                out = x
+            else:
+                out = np.empty(x.shape, dtype=dtype)
+
+        np.clip(x, 10.0 ** low, 10.0 ** high, out=out)
+        np.log10(out, out=out)
+        out -= low
+        out /= (high - low)
+
+        return out
+
+
 class Flatten():
     """
     Filter for flattening the data
@@ -103,7 +450,14 @@ class Log10():
     """
     Calculate the log10 of all non zero values in the sample.
     """
+    batchable = True
+
     def __call__(self, sample):
+        if isinstance(sample, torch.Tensor):
+            non_zero = sample != 0
+            sample[non_zero] = torch.log10(sample[non_zero])
+            return sample
+
         non_zero_indexes = np.where(sample != 0)
 
         # Talk log10 of all non_zero values
@@ -120,11 +474,21 @@ class Roll():
         self.shift = shift
         self.axis = axis
 
+    @property
+    def batchable(self):
+        """
+        Only a negative axis can be used for a batch.
+        """
+        return np.ndim(self.axis) == 0 and self.axis < 0
+
     def __call__(self, sample):
         x = sample
 
         # Roll along Phi
-        x = np.roll(x, self.shift, axis=self.axis)
+        if isinstance(x, torch.Tensor):
+            x = torch.roll(x, self.shift, dims=self.axis)
+        else:
+            x = np.roll(x, self.shift, axis=self.axis)
 
         return x
 
@@ -137,7 +501,16 @@ class MoveAxis():
         self.src = src
         self.dst = dst
 
+    @property
+    def batchable(self):
+        """
+        Only negative axes can be used for a batch.
+        """
+        return self.src < 0 and self.dst < 0
+
     def __call__(self, sample):
+        if isinstance(sample, torch.Tensor):
+            return torch.movedim(sample, self.src, self.dst)
         return np.moveaxis(sample, self.src, self.dst)
 
 
@@ -148,10 +521,20 @@ class Sum():
     def __init__(self, axis=-1):
         self.axis = axis
 
+    @property
+    def batchable(self):
+        """
+        Only negative axes can be used for a batch.
+        """
+        return self.axis is not None and np.all(np.asarray(self.axis) < 0)
+
     def __call__(self, sample):
         x = sample
 
-        x = np.sum(x, axis=self.axis)
+        if isinstance(x, torch.Tensor):
+            x = torch.sum(x, dim=self.axis)
+        else:
+            x = np.sum(x, axis=self.axis)
 
         return x
 
@@ -163,9 +546,157 @@ class Mean():
     def __init__(self, axis=-1):
         self.axis = axis
 
+    @property
+    def batchable(self):
+        """
+        Only negative axes can be used for a batch.
+        """
+        return self.axis is not None and np.all(np.asarray(self.axis) < 0)
+
     def __call__(self, sample):
         x = sample
 
-        x = np.mean(x, axis=self.axis)
+        if isinstance(x, torch.Tensor):
+            x = torch.mean(x, dim=self.axis)
+        else:
+            x = np.mean(x, axis=self.axis)
 
         return x
+
+
+def _apply_ufunc(ufunc, x, owned, *args):
+    """
+    Apply a ufunc, in place if x is owned and has the shape and data type
+    of the result.
+    """
+    dtypes = [type(a) if type(a) in (int, float) else np.asarray(a).dtype
+              for a in args]
+    # The output type, e.g. float for division of integers
+    dtype = ufunc.resolve_dtypes((x.dtype, *dtypes, None))[-1]
+    if owned and dtype == x.dtype and \
+            np.broadcast_shapes(x.shape, *[np.shape(a) for a in args]) == \
+            x.shape:
+        return ufunc(x, *args, out=x)
+    return ufunc(x, *args)
+
+
+class _Elementwise():
+    """
+    Apply elementwise transforms, allocating at most one new array.
+    """
+    def __init__(self, *transforms):
+        self.transforms = transforms
+
+    @property
+    def batchable(self):
+        """
+        If all the transforms can be applied to a batch.
+        """
+        return all(trans.batchable for trans in self.transforms)
+
+    def __call__(self, sample):
+        if isinstance(sample, torch.Tensor):
+            for trans in self.transforms:
+                sample = trans(sample)
+            return sample
+
+        x = sample
+        # If x can be changed in place, the input sample is only changed
+        # by transforms that also do so when not compiled.
+        owned = False
+
+        for trans in self.transforms:
+            inplace = isinstance(x, np.ndarray) and x.dtype.kind == 'f' \
+                and x.flags.writeable
+
+            if isinstance(trans, Threshold) and inplace:
+                np.clip(x, x.dtype.type(trans.thresholds[0]),
+                        x.dtype.type(trans.thresholds[1]), out=x)
+            elif isinstance(trans, Log10) and inplace:
+                np.log10(x, out=x, where=x != 0)
+            elif isinstance(trans, LogNorm):
+                x = _apply_ufunc(np.log10, x, owned and inplace)
+                if trans.normalization is None:
+                    x -= x.min()
+                    x /= x.max()
+                else:
+                    x -= trans.normalization[0]
+                    x /= (trans.normalization[1] - trans.normalization[0])
+            elif isinstance(trans, ZScoreNorm):
+                x = _apply_ufunc(np.subtract, x, owned and inplace,
+                                 trans.mean)
+                x = _apply_ufunc(np.divide, x, True, trans.std)
+            else:
+                x = trans(x)
+            owned = True
+
+        return x
+
+
+class _IndexRoll():
+    """
+    Roll along an axis using precomputed indices.
+    """
+    def __init__(self, shift, axis):
+        self.shift = shift
+        self.axis = axis
+        self._indices = {}
+
+    @property
+    def batchable(self):
+        """
+        Only a negative axis can be used for a batch.
+        """
+        return self.axis < 0
+
+    def __call__(self, sample):
+        if isinstance(sample, torch.Tensor):
+            return torch.roll(sample, self.shift, dims=self.axis)
+
+        size = np.shape(sample)[self.axis]
+        if size not in self._indices:
+            self._indices[size] = (np.arange(size) - self.shift) % size
+        return np.take(sample, self._indices[size], axis=self.axis)
+
+
+_ELEMENTWISE = (Threshold, ClipLogNorm, LogNorm, Log10, ZScoreNorm)
+
+
+def _fuse(transforms):
+    """
+    Fuse a list of transforms, see Compose.compile.
+    """
+    transforms = list(transforms)
+
+    # Move reductions before rolls, the roll is not needed at all if the
+    # reduction is along the rolled axis.
+    i = 0
+    while i < len(transforms) - 1:
+        trans, following = transforms[i], transforms[i + 1]
+        if type(trans) is Roll and type(following) in (Sum, Mean) and \
+                np.ndim(trans.axis) == 0 and trans.axis < 0 and \
+                following.batchable:
+            axes = np.atleast_1d(following.axis)
+            if trans.axis in axes:
+                del transforms[i]
+            else:
+                axis = trans.axis + int(np.sum(axes > trans.axis))
+                transforms[i:i + 2] = [following, Roll(trans.shift, axis)]
+            i = max(i - 1, 0)
+        else:
+            i += 1
+
+    fused = []
+    for trans in transforms:
+        if type(trans) in _ELEMENTWISE:
+            if fused and isinstance(fused[-1], _Elementwise):
+                fused[-1] = _Elementwise(*fused[-1].transforms, trans)
+            else:
+                fused.append(_Elementwise(trans))
+        elif type(trans) is Roll and np.ndim(trans.axis) == 0 and \
+                np.ndim(trans.shift) == 0:
+            fused.append(_IndexRoll(trans.shift, trans.axis))
+        else:
+            fused.append(trans)
+
+    return fused
@@ -6,15 +6,50 @@ import numpy as np
 import pandas as pd
 import cdflib
 
+from .cdf_pool import CDFPool
+from ..__init__ import _MAX_OPEN_CDF_FILES
 
-def read_cdf_file(cdf_filepath, variables=None):
+# The CDF files opened by read_cdf_file in this process
+_CDF_POOL = CDFPool(_MAX_OPEN_CDF_FILES)
+
+
+def _read_records(cdf_file, var, records):
+    """
+    Read records of a varible, decoding only the records needed.
+    """
+    if isinstance(records, range) and records.step == 1 and len(records) > 0:
+        return np.asarray(cdf_file.varget(var, startrec=records.start,
+                                          endrec=records.stop - 1))
+
+    records = np.asarray(records, dtype=np.int64)
+    if len(records) == 0:
+        return np.asarray(cdf_file.varget(var, startrec=0, endrec=0))[:0]
+
+    # Read each run of consecutive records with one call
+    unique = np.unique(records)
+    runs = np.split(unique, np.flatnonzero(np.diff(unique) != 1) + 1)
+    data = np.concatenate([
+        np.asarray(cdf_file.varget(var, startrec=int(run[0]),
+                                   endrec=int(run[-1])))
+        for run in runs])
+
+    return data[np.searchsorted(unique, records)]
+
+
+def read_cdf_file(cdf_filepath, variables=None, records=None):
     """
     Read a cdf file, either fully or only a subset.
 
+    When reading varibles the file is kept open, in a pool of open files, for
+    later reads.
+
     Args:
         cdf_filepath (string): Path to the CDF file.
         variables (list): List with tuples the names to store
                     the varibles in and varibles to read.
+        records (list): Only read these records (indices) of the varibles,
+                    either a list/array of records or a range. The records
+                    are returned in the given order.
     Returns:
         Dictionary with the varibles.
     """
@@ -22,31 +57,112 @@ def read_cdf_file(cdf_filepath, variables=None):
         return cdflib.cdfread.CDF(cdf_filepath)
 
     data = {}
-    cdf_file = cdflib.cdfread.CDF(cdf_filepath)
-    for name, var in variables:
-        try:
-            data[name] = np.array((cdf_file.varget(var)))
-        except:
-            print(f'Failed to read {var} from {cdf_filepath}')
-            raise
+    with _CDF_POOL.open(cdf_filepath) as cdf_file:
+        for name, var in variables:
+            try:
+                if records is None:
+                    data[name] = np.array((cdf_file.varget(var)))
+                else:
+                    data[name] = _read_records(cdf_file, var, records)
+            except:
+                print(f'Failed to read {var} from {cdf_filepath}')
+                raise
 
     return data
 
 
-def pandas_read_file(filepath):
+def _parse_time(t):
+    """
+    Parse a time given as a datetime or a string with the format
+    YYYY-mm-DD or YYYY-mm-DD/HH:MM:SS.
+    """
+    if isinstance(t, str):
+        t = t.replace('/', ' ')
+    return pd.Timestamp(t)
+
+
+def _filter_trange(dataset, trange):
+    """
+    Select the rows of a dataset inside a time range, using the Time column
+    or the index.
+    """
+    if 'Time' in dataset.columns:
+        time = pd.to_datetime(dataset['Time'])
+    elif isinstance(dataset.index, pd.DatetimeIndex):
+        time = dataset.index
+    else:
+        raise ValueError('Dataset has no time to select a time range on')
+
+    return dataset.loc[(_parse_time(trange[0]) <= time) &
+                       (time < _parse_time(trange[1]))]
+
+
+def _to_categorical(dataset, categorical):
+    """
+    Convert the selected columns of a dataset to categoricals.
+    """
+    if categorical is None:
+        return dataset
+
+    columns = {c: 'category' for c in dataset.columns
+               if categorical(c) and dataset[c].dtype != 'category'}
+    return dataset.astype(columns) if columns else dataset
+
+
+def pandas_read_file(filepath, columns=None, trange=None, categorical=None):
     """
     Wrapper to handle reading data from multiple different file formats.
 
+    Parquet datasets are stored partitioned by month, and only the
+    partitions overlapping the time range are read.
+
     Args:
         filepath (string): The file path including file extension.
+        columns (list): Only read these columns.
+        trange (list): Only read rows with start <= Time < end, the times
+            can be datetimes or strings with the format YYYY-mm-DD or
+            YYYY-mm-DD/HH:MM:SS.
+        categorical (callable): Read the columns for which categorical(name)
+            is True as categoricals, storing each distinct value once.
     Returns:
         A pandas DataFrame read from the given file path.
     """
 
+    read_columns = columns
+    if columns is not None and trange is not None and 'Time' not in columns:
+        read_columns = list(columns) + ['Time']
+
     _, fileformat = path.splitext(filepath)
     if fileformat == '.csv':
-        return pd.read_csv(filepath)
-    if fileformat == '.feather':
-        return pd.read_feather(filepath)
+        dtype = None
+        if categorical is not None:
+            header = pd.read_csv(filepath, nrows=0).columns
+            dtype = {c: 'category' for c in header if categorical(c)}
+        dataset = pd.read_csv(filepath, usecols=read_columns, dtype=dtype)
+    elif fileformat == '.feather':
+        dataset = pd.read_feather(filepath, columns=read_columns)
+    elif fileformat == '.parquet':
+        filters = None
+        if trange is not None:
+            start, end = _parse_time(trange[0]), _parse_time(trange[1])
+            filters = [('month', '>=', start.strftime('%Y-%m')),
+                       ('month', '<=', end.strftime('%Y-%m')),
+                       ('Time', '>=', start), ('Time', '<', end)]
+        dataset = pd.read_parquet(filepath, columns=columns,
+                                  filters=filters)
+        if 'month' in dataset.columns:
+            dataset = dataset.drop(columns=['month'])
+        if not isinstance(dataset.index, pd.DatetimeIndex):
+            dataset = dataset.reset_index(drop=True)
+        return _to_categorical(dataset, categorical)
+    else:
+        raise ValueError(f'Unknown filetype: {fileformat}')
+
+    if trange is not None:
+        dataset = _filter_trange(dataset, trange)
+        if read_columns is not columns:
+            dataset = dataset.drop(columns=['Time'])
+        if not isinstance(dataset.index, pd.DatetimeIndex):
+            dataset = dataset.reset_index(drop=True)
 
-    raise ValueError(f'Unknown filetype: {fileformat}')
+    return _to_categorical(dataset, categorical)
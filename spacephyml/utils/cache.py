@@ -0,0 +1,362 @@
+"""
+Caches for data read from files.
+"""
+from os import path, makedirs, replace, remove, rename, stat, getpid, walk
+from shutil import rmtree
+import tempfile
+from glob import glob, escape
+from collections import OrderedDict
+import hashlib
+import inspect
+import threading
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class LRUCache():
+    """
+    Least recently used cache with a limit on the total size, in bytes, of
+    the stored values.
+
+    Pinned entries are never evicted and do not count towards the size
+    limit. Entries can be pinned before they are stored.
+
+    Examples:
+        >>> import numpy as np
+        >>> from spacephyml.utils.cache import LRUCache
+        >>> cache = LRUCache(max_bytes=2**30)
+        >>> cache.put('file.cdf', np.zeros(10))
+        >>> cache.get('file.cdf')
+
+    Args:
+        max_bytes (int): The largest total size of the unpinned values, or
+            None for no limit.
+        pinned (list): Keys to pin.
+    """
+
+    def __init__(self, max_bytes=None, pinned=None):
+        self.max_bytes = max_bytes
+        self.pinned = set(pinned or [])
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.nbytes = 0
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # The values are not pickled, e.g. when the dataset is sent to
+        # DataLoader workers, and the lock can not be pickled.
+        state = self.__dict__.copy()
+        del state['_entries'], state['_lock']
+        state['nbytes'] = 0
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None):
+        """
+        Get a value, marking it as the most recently used.
+
+        Args:
+            key (hashable): The key of the value.
+            default (object): Returned if the key is not in the cache.
+
+        Returns:
+            The value, or default if the key is not in the cache.
+        """
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return default
+
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key, value):
+        """
+        Store a value, evicting the least recently used values if the cache
+        becomes larger than max_bytes. Unpinned values larger than max_bytes
+        are not stored.
+
+        Args:
+            key (hashable): The key of the value.
+            value (array): The value, the size is taken from value.nbytes.
+        """
+        nbytes = value.nbytes if key not in self.pinned else 0
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            if self.max_bytes is not None and nbytes > self.max_bytes:
+                return
+
+            self._entries[key] = value
+            self.nbytes += nbytes
+            self._evict()
+
+    def pin(self, key):
+        """
+        Pin a key, so that its value is never evicted.
+        """
+        with self._lock:
+            if key in self._entries and key not in self.pinned:
+                self.nbytes -= self._entries[key].nbytes
+            self.pinned.add(key)
+
+    def unpin(self, key):
+        """
+        Unpin a key, allowing its value to be evicted.
+        """
+        with self._lock:
+            if key not in self.pinned:
+                return
+            self.pinned.remove(key)
+            if key in self._entries:
+                self.nbytes += self._entries[key].nbytes
+                self._evict()
+
+    def clear(self):
+        """
+        Remove all values, the counters are kept.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        """
+        Get the cache counters.
+
+        Returns:
+            Dictionary with the number of hits, misses and evictions, the
+            number of entries and the size of the unpinned values.
+        """
+        return {'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'entries': len(self._entries),
+                'nbytes': self.nbytes}
+
+    def _remove(self, key):
+        value = self._entries.pop(key)
+        if key not in self.pinned:
+            self.nbytes -= value.nbytes
+
+    def _evict(self):
+        if self.max_bytes is None:
+            return
+
+        for key in list(self._entries):
+            if self.nbytes <= self.max_bytes:
+                break
+            if key in self.pinned:
+                continue
+            self._remove(key)
+            self.evictions += 1
+
+
+def _store_shared_array(prefix, filepath, read):
+    data = np.asarray(read())
+
+    # Remove scratch files for older versions of the source file
+    for old in glob(f'{escape(prefix)}.*.npy'):
+        if old != filepath:
+            try:
+                remove(old)
+            except FileNotFoundError:
+                pass
+
+    tmp_filepath = f'{filepath}.{getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_filepath, 'wb') as f:
+        np.save(f, data)
+    replace(tmp_filepath, filepath)
+
+
+def load_shared_array(cache_dir, source_filepath, name, read):
+    """
+    Load an array through a scratch file shared between processes.
+
+    The first process to request the array reads it with read() and stores
+    it as a .npy file in cache_dir, written to a temporary file and renamed
+    so other processes never see a partial file. The read is guarded by a
+    lock file, so processes requesting the array at the same time wait for
+    the first one instead of all reading it. All processes then memory
+    map the file, sharing one copy through the page cache. The scratch file
+    is keyed by the name, size and modification time of the source file and
+    is rebuilt if the source file changes.
+
+    Args:
+        cache_dir (string): Directory for the scratch files.
+        source_filepath (string): The file the array is read from.
+        name (string): Name of the array within the source file.
+        read (callable): Function reading the array.
+
+    Returns:
+        A read-only memory mapped array.
+    """
+    file_stat = stat(source_filepath)
+    _, filename = path.split(source_filepath)
+    prefix = f'{cache_dir}/{filename}.{name}'
+    filepath = f'{prefix}.{file_stat.st_size}.{file_stat.st_mtime_ns}.npy'
+
+    if not path.isfile(filepath):
+        makedirs(cache_dir, exist_ok=True)
+        with open(f'{prefix}.lock', 'a', encoding='utf-8') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+
+            # Another process may have stored the array while we waited
+            if not path.isfile(filepath):
+                _store_shared_array(prefix, filepath, read)
+
+    return np.load(filepath, mmap_mode='r')
+
+
+def open_sample_cache(cache_dir, key, length, sample):
+    """
+    Open, or create, a memory mapped store for samples, filled in as the
+    samples are computed.
+
+    The store is the directory '{cache_dir}/{key}' with the samples in
+    'samples.npy' and a flag for each stored sample in 'stored.npy'. An
+    empty 'tensor' file marks that the samples are torch tensors. It is
+    created in a temporary directory and renamed, so processes opening the
+    store at the same time all get the same store. The memory maps are
+    shared, so samples stored by one process (e.g. a DataLoader worker) are
+    seen by the others.
+
+    Args:
+        cache_dir (string): Directory for the stores.
+        key (string): The key of the store, e.g. from config_hash.
+        length (int): The number of samples.
+        sample (callable): Function returning a sample (an array or a
+            torch tensor), giving the shape and data type. Only called if
+            the store is created.
+
+    Returns:
+        Tuple with the samples and the stored flags, as writable memory
+        mapped arrays, and if the samples are torch tensors.
+    """
+    store_path = f'{cache_dir}/{key}'
+    if not path.isdir(store_path):
+        makedirs(cache_dir, exist_ok=True)
+        tmp_path = tempfile.mkdtemp(dir=cache_dir, prefix=f'.{key}.')
+        sample = sample()
+        if not isinstance(sample, np.ndarray) and hasattr(sample, 'numpy'):
+            with open(f'{tmp_path}/tensor', 'w', encoding='utf-8'):
+                pass
+        sample = np.asarray(sample)
+        np.lib.format.open_memmap(f'{tmp_path}/samples.npy', mode='w+',
+                                  dtype=sample.dtype,
+                                  shape=(length,) + sample.shape).flush()
+        np.lib.format.open_memmap(f'{tmp_path}/stored.npy', mode='w+',
+                                  dtype=np.uint8, shape=(length,)).flush()
+        try:
+            rename(tmp_path, store_path)
+        except OSError:
+            # Created by another process
+            rmtree(tmp_path)
+
+    return (np.load(f'{store_path}/samples.npy', mmap_mode='r+'),
+            np.load(f'{store_path}/stored.npy', mmap_mode='r+'),
+            path.isfile(f'{store_path}/tensor'))
+
+
+def _update_hash(digest, value):
+    """
+    Add a value to a hash, see config_hash.
+    """
+    if value is None or isinstance(value, (bool, int, float, complex, str,
+                                           bytes, np.generic)):
+        digest.update(f'{type(value).__name__}:{value!r};'.encode())
+    elif isinstance(value, np.ndarray):
+        digest.update(f'ndarray:{value.dtype}:{value.shape};'.encode())
+        digest.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, (list, tuple)):
+        digest.update(f'{type(value).__name__}:{len(value)};'.encode())
+        for item in value:
+            _update_hash(digest, item)
+    elif isinstance(value, dict):
+        digest.update(f'dict:{len(value)};'.encode())
+        for key in sorted(value, key=repr):
+            _update_hash(digest, key)
+            _update_hash(digest, value[key])
+    elif isinstance(value, (type, np.dtype)):
+        digest.update(f'type:{value!r};'.encode())
+    elif hasattr(value, '__array__'):
+        # E.g. torch tensors
+        _update_hash(digest, np.asarray(value))
+    elif hasattr(value, '__dict__') and not inspect.isroutine(value):
+        cls = type(value)
+        digest.update(f'object:{cls.__module__}.{cls.__qualname__};'.encode())
+        _update_hash(digest, {k: v for k, v in vars(value).items()
+                              if not k.startswith('_')})
+    else:
+        raise ValueError(f'Can not hash {value!r}, only numbers, strings, ' +
+                         'arrays, containers and objects with attributes ' +
+                         'are supported')
+
+
+def config_hash(*values):
+    """
+    Stable hash of configuration values, the same between processes and
+    runs.
+
+    Objects, e.g. transforms, are hashed by their class and their public
+    attributes. Functions (including lambdas) are not supported, as their
+    behaviour can not be hashed.
+
+    Args:
+        values: Numbers, strings, arrays, lists, tuples, dictionaries and
+            objects with attributes.
+
+    Returns:
+        The hash as a hex string.
+    """
+    digest = hashlib.sha256()
+    _update_hash(digest, values)
+    return digest.hexdigest()
+
+
+def file_hash(filepath):
+    """
+    Hash identifying the version of a file, or of all files in a directory,
+    based on the path, size and modification time of the files. The files
+    are not read, so hashing large datasets is cheap.
+
+    Args:
+        filepath (string): Path to the file or directory.
+
+    Returns:
+        The hash as a hex string.
+    """
+    filepath = path.abspath(filepath)
+    if path.isdir(filepath):
+        filepaths = sorted(path.join(root, name)
+                           for root, _, names in walk(filepath)
+                           for name in names)
+    else:
+        filepaths = [filepath]
+
+    digest = hashlib.sha256(filepath.encode())
+    for name in filepaths:
+        file_stat = stat(name)
+        digest.update(f'{path.relpath(name, filepath)}.{file_stat.st_size}.'
+                      f'{file_stat.st_mtime_ns}'.encode())
+    return digest.hexdigest()
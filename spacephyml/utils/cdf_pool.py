@@ -0,0 +1,100 @@
+"""
+Pool of open CDF files.
+"""
+from collections import OrderedDict
+from contextlib import contextmanager
+from os import path, stat, getpid
+import threading
+import cdflib
+
+
+class CDFPool():
+    """
+    Process local pool of open CDF files, so that the file header and
+    variable records are only parsed once per file.
+
+    The least recently used files are closed when more than max_open files
+    are open. Each file can only be used by one thread at the time, and the
+    pool is reset in processes forked from the process that created it, so
+    the file handles are never shared between processes. Files are reopened
+    if they change size or modification time.
+
+    Examples:
+        >>> from spacephyml.utils.cdf_pool import CDFPool
+        >>> pool = CDFPool(max_open=8)
+        >>> with pool.open('./file.cdf') as cdf_file:
+        ...     epochs = cdf_file.varget('Epoch')
+
+    Args:
+        max_open (int): The largest number of open files.
+    """
+
+    def __init__(self, max_open=32):
+        self.max_open = max_open
+        self.hits = 0
+        self.misses = 0
+        self._reset()
+
+    def _reset(self):
+        self._pid = getpid()
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _get(self, cdf_filepath):
+        """
+        Get the entry (CDF object, lock and file version) for a file,
+        opening the file if needed.
+        """
+        if self._pid != getpid():
+            self._reset()
+
+        cdf_filepath = path.abspath(cdf_filepath)
+        file_stat = stat(cdf_filepath)
+        version = (file_stat.st_size, file_stat.st_mtime_ns)
+
+        with self._lock:
+            entry = self._entries.get(cdf_filepath)
+            if entry is not None and entry[2] == version:
+                self.hits += 1
+                self._entries.move_to_end(cdf_filepath)
+                return entry
+            self.misses += 1
+
+        # Parse the file outside of the pool lock
+        entry = (cdflib.cdfread.CDF(cdf_filepath), threading.Lock(), version)
+
+        with self._lock:
+            self._entries[cdf_filepath] = entry
+            self._entries.move_to_end(cdf_filepath)
+
+            # The file is closed when the CDF object is deleted, files in
+            # use by another thread are closed when that thread is done.
+            while len(self._entries) > self.max_open:
+                self._entries.popitem(last=False)
+
+        return entry
+
+    @contextmanager
+    def open(self, cdf_filepath):
+        """
+        Get an open CDF file, locked for use by the calling thread.
+
+        Args:
+            cdf_filepath (string): Path to the CDF file.
+
+        Returns:
+            A context manager giving the cdflib CDF object.
+        """
+        cdf_file, lock, _ = self._get(cdf_filepath)
+        with lock:
+            yield cdf_file
+
+    def clear(self):
+        """
+        Close all the files.
+        """
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,107 @@
+"""
+Persistent index of the epochs stored in local CDF files.
+"""
+from os import path, makedirs, replace, remove, stat, getpid
+from glob import glob, escape
+import numpy as np
+
+from . import read_cdf_file
+
+_EPOCH_INDEX_DIR = '.epoch_index'
+
+
+def _index_filepath(index_dir, cdf_filepath):
+    """
+    Get the path of the index entry for a CDF file, the entry is keyed by the
+    filename, file size and modification time.
+    """
+    file_stat = stat(cdf_filepath)
+    _, filename = path.split(cdf_filepath)
+    return (f'{index_dir}/{filename}.{file_stat.st_size}.'
+            f'{file_stat.st_mtime_ns}.npy')
+
+
+def read_cdf_epochs(rootdir, cdf_filepath, epoch_var='Epoch'):
+    """
+    Read the epochs from a CDF file using a persistent index.
+
+    The epochs are stored as a int64 array in a sidecar index in the
+    `.epoch_index` directory under the root directory, and read back
+    memory-mapped. The entry is rebuilt if the CDF file changes size or
+    modification time.
+
+    Args:
+        rootdir (string): The root directory of the data storage.
+        cdf_filepath (string): Path to the CDF file, relative to rootdir.
+        epoch_var (string): The epoch varible in the CDF file.
+
+    Returns:
+        A read-only int64 array with the epochs.
+    """
+    index_dir = path.abspath(f'{rootdir}/{_EPOCH_INDEX_DIR}')
+    cdf_filepath = path.abspath(f'{rootdir}/{cdf_filepath}')
+
+    index_filepath = _index_filepath(index_dir, cdf_filepath)
+    if path.isfile(index_filepath):
+        return np.load(index_filepath, mmap_mode='r')
+
+    epochs = np.asarray(read_cdf_file(cdf_filepath,
+                                      [('epoch', epoch_var)])['epoch'],
+                        dtype=np.int64)
+
+    try:
+        makedirs(index_dir, exist_ok=True)
+
+        # Remove entries for older versions of the file
+        _, filename = path.split(cdf_filepath)
+        for old in glob(f'{index_dir}/{escape(filename)}.*.npy'):
+            if old != index_filepath:
+                try:
+                    remove(old)
+                except FileNotFoundError:
+                    pass
+
+        # Write to a temporary file first so that other processes never
+        # see a partial entry.
+        tmp_filepath = f'{index_filepath}.{getpid()}.tmp'
+        with open(tmp_filepath, 'wb') as f:
+            np.save(f, epochs)
+        replace(tmp_filepath, index_filepath)
+        return np.load(index_filepath, mmap_mode='r')
+    except OSError:
+        # The index is only an optimization, read-only data directories
+        # still work without it.
+        return epochs
+
+
+def epoch_to_record(file_epochs, epochs):
+    """
+    Find the record numbers of epochs in the epochs of a CDF file.
+
+    Args:
+        file_epochs (array): The epochs stored in the CDF file.
+        epochs (array): The epochs to find.
+
+    Returns:
+        An int64 array with the record number of each epoch.
+    """
+    file_epochs = np.asarray(file_epochs)
+    epochs = np.asarray(epochs, dtype=np.int64)
+    if len(file_epochs) == 0:
+        if len(epochs) == 0:
+            return np.zeros(0, dtype=np.int64)
+        raise ValueError('Epochs not found in file')
+
+    sorter = None
+    if np.any(file_epochs[1:] < file_epochs[:-1]):
+        sorter = np.argsort(file_epochs, kind='stable')
+
+    records = np.searchsorted(file_epochs, epochs, sorter=sorter)
+    records = np.minimum(records, len(file_epochs) - 1)
+    if sorter is not None:
+        records = sorter[records]
+
+    if not np.array_equal(file_epochs[records], epochs):
+        raise ValueError('Epochs not found in file')
+
+    return records.astype(np.int64)
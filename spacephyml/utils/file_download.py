@@ -2,13 +2,14 @@
 Utils for file downloads.
 """
 
-import functools
-from os import path
-from shutil import copyfileobj, copy
-from tempfile import NamedTemporaryFile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from os import path, remove, replace
 from tqdm.auto import tqdm
 import requests
 
+_CHUNK_SIZE = 1024 * 1024
+
 
 def missing_files(files, rootdir=''):
     """
@@ -34,6 +35,91 @@ def missing_files(files, rootdir=''):
     return missing
 
 
+class _Progress():
+    """
+    Thread safe byte counting progress bar, where the total is increased as
+    the size of each download becomes known.
+    """
+    def __init__(self, desc=None):
+        self._lock = threading.Lock()
+        self._bar = tqdm(total=0, unit='B', unit_scale=True, desc=desc)
+
+    def add_total(self, size):
+        """
+        Add size bytes to the expected total.
+        """
+        with self._lock:
+            self._bar.total += size
+            self._bar.refresh()
+
+    def update(self, size):
+        """
+        Add size bytes to the downloaded bytes.
+        """
+        with self._lock:
+            self._bar.update(size)
+
+    def close(self):
+        """
+        Close the progress bar.
+        """
+        self._bar.close()
+
+
+def _download_file(url_file, filepath, session, progress):
+    """
+    Download one file, resuming a previous partial download if one exists.
+
+    The data is written to '{filepath}.part' and renamed to filepath once
+    the download is complete. This prevents a failed (or aborted) download
+    to block future downloads, and lets the next attempt continue where the
+    last one stopped.
+
+    Args:
+        url_file (string) : The URL for downloading the file.
+        filepath (string) : The file path for storing the file.
+        session : The request session to use.
+        progress (_Progress) : The progress to update with the downloaded
+            bytes.
+    """
+    part_filepath = f'{filepath}.part'
+    offset = path.getsize(part_filepath) if path.isfile(part_filepath) else 0
+
+    headers = {}
+    if offset > 0:
+        # Resume using a HTTP Range request, the offset refers to the
+        # unencoded data so disable content encoding.
+        headers = {'Range': f'bytes={offset}-', 'Accept-Encoding': 'identity'}
+
+    with session.get(url_file, stream=True, verify=True,
+                     headers=headers) as r:
+        if r.status_code == 416 and offset > 0:
+            # The partial file is not valid for the server file, restart.
+            remove(part_filepath)
+            _download_file(url_file, filepath, session, progress)
+            return
+
+        if r.status_code == 206 and offset > 0:
+            mode = 'ab'
+        elif r.status_code == 200:
+            mode = 'wb'
+            offset = 0
+        else:
+            r.raise_for_status()  # Will only raise for 4xx codes, so...
+            raise RuntimeError(f"Request to {url_file} returned status code " +
+                               f"{r.status_code}")
+
+        progress.add_total(int(r.headers.get('Content-Length', 0)) + offset)
+        progress.update(offset)
+
+        with open(part_filepath, mode) as f:
+            for chunk in r.iter_content(chunk_size=_CHUNK_SIZE):
+                f.write(chunk)
+                progress.update(len(chunk))
+
+    replace(part_filepath, filepath)
+
+
 def download_file_with_status(url_file, filepath, session=None):
     """
     Download one file with a progress bar.
@@ -48,28 +134,55 @@ def download_file_with_status(url_file, filepath, session=None):
         close_session = True
         session = requests.Session()
 
-    r = session.get(url_file, stream=True, verify=True)
-
-    # Code for status bar from:
-    # https://stackoverflow.com/questions/37573483/progress-bar-while-download-file-over-http-with-requests
-    if r.status_code != 200:
-        r.raise_for_status()  # Will only raise for 4xx codes, so...
-        raise RuntimeError("Request to {url_file} returned status code " +
-                           f"{r.status_code}")
-    file_size = int(r.headers.get('Content-Length', 0))
-
-    desc = "(Unknown total file size)" if file_size == 0 else ""
-    r.raw.read = functools.partial(r.raw.read, decode_content=True)
-    with NamedTemporaryFile() as ftmp:
-        with tqdm.wrapattr(r.raw, "read", total=file_size, desc=desc) as r_raw:
-            with open(ftmp.name, 'wb') as f:
-                copyfileobj(r_raw, f)
-
-        # If the download was successful, copy to data directory.
-        # This prevents a failed (or aborted) download to block
-        # future downloads.
-        copy(ftmp.name, filepath)
-        r.close()
+    progress = _Progress()
+    try:
+        _download_file(url_file, filepath, session, progress)
+    finally:
+        progress.close()
 
     if close_session:
         session.close()
+
+
+def download_files(downloads, workers=4, desc='Downloading'):
+    """
+    Download multiple files concurrently with one combined progress bar.
+
+    Each worker thread uses its own request session, so connections are
+    reused between the files downloaded by the same worker.
+
+    Args:
+        downloads (list) : Tuples with the URL and file path for each file.
+        workers (int) : The maximum number of concurrent downloads.
+        desc (string) : Description shown with the progress bar.
+    """
+    local = threading.local()
+    sessions = []
+    sessions_lock = threading.Lock()
+
+    def get_session():
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_maxsize=1)
+            local.session.mount('https://', adapter)
+            local.session.mount('http://', adapter)
+            with sessions_lock:
+                sessions.append(local.session)
+        return local.session
+
+    def download(url_file, filepath):
+        _download_file(url_file, filepath, get_session(), progress)
+
+    progress = _Progress(desc)
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(download, url_file, filepath)
+                       for url_file, filepath in downloads]
+
+            # Raise the first failure, after the other downloads finished
+            for future in futures:
+                future.result()
+    finally:
+        progress.close()
+        for session in sessions:
+            session.close()
@@ -1,10 +1,13 @@
 """
 Dataset utils specific to MMS.
 """
-from os import path, makedirs
+from os import path, makedirs, listdir, replace, getpid
+import datetime as dt
+import json
+import time
 import requests
 
-from .file_download import download_file_with_status
+from .file_download import download_file_with_status, download_files
 
 
 def filename_to_filepath(filename):
@@ -42,15 +45,111 @@ def filename_to_filepath(filename):
 
 _MMS_DATA_BASE_URL = 'https://lasp.colorado.edu/mms/sdc/public/files/api/v1/'
 
+# Cache directory (relative to the data root) and lifetime of file lists
+_FILE_LIST_DIR = '.file_lists'
+_FILE_LIST_TTL = 24 * 60 * 60
+
+
+def _query_file_list(start_date, end_date, data_rate, data_level, datatype,
+                     instrument, sc_id):
+    """
+    Query the MMS Science Data center for a list of files.
+    """
+    url = f'{_MMS_DATA_BASE_URL}file_info/science?'
+    url += f'start_date={start_date}&end_date={end_date}&sc_id={sc_id}'
+    url += f'&instrument_id={instrument}'
+    url += f'&data_rate_mode={data_rate}&data_level={data_level}'
+    if datatype is not None:
+        url += f'&descriptor={datatype}'
+
+    with requests.Session() as session:
+        r = session.get(url)
+        files = r.json()['files']
+        r.close()
+
+    return files
+
+
+def _file_day(filename):
+    """
+    Get the start day (YYYY-MM-DD) of a mms CDF file from its filename.
+    """
+    time = filename.split('_')[-2]
+    return f'{time[:4]}-{time[4:6]}-{time[6:8]}'
+
+
+def _file_start(filename):
+    """
+    Get the start time of a mms CDF file from its filename. Burst and fast
+    files have the time as YYYYmmddHHMMSS, daily (e.g. survey) files only
+    have the day as YYYYmmdd.
+    """
+    time = filename.split('_')[-2]
+    formats = {8: '%Y%m%d', 10: '%Y%m%d%H', 12: '%Y%m%d%H%M',
+               14: '%Y%m%d%H%M%S'}
+    if len(time) not in formats:
+        raise ValueError(f'Unknown time format in filename {filename}')
+    return dt.datetime.strptime(time, formats[len(time)])
+
+
+def _file_version(filename):
+    """
+    Get the version of a mms CDF file as a tuple of integers.
+    """
+    version = filename.split('_')[-1][1:-4]
+    return tuple(int(v) for v in version.split('.') if v.isdigit())
+
+
+def _local_file_list(rootdir, days, data_rate, data_level, datatype,
+                     instrument, sc_id):
+    """
+    List the newest version of the files stored in rootdir for the given
+    days, using the same directory structure as filename_to_filepath.
+    """
+    prefix = [sc_id, instrument, data_rate, data_level]
+    if datatype is not None:
+        prefix.append(datatype)
+
+    files = {}
+    for month in sorted({day[:7] for day in days}):
+        year, month = month.split('-')
+        dirpath = f'{rootdir}/mms/' + '/'.join(prefix) + f'/{year}/{month}'
+        if not path.isdir(dirpath):
+            continue
+
+        for filename in listdir(dirpath):
+            fs = filename.split('_')
+            if not filename.endswith('.cdf') or fs[:-2] != prefix or \
+                    _file_day(filename) not in days:
+                continue
+
+            # Only keep the latest version of each file
+            key = fs[-2]
+            if key not in files or \
+                    _file_version(files[key]) < _file_version(filename):
+                files[key] = filename
+
+    return [{'file_name': filename,
+             'file_size': path.getsize(
+                 path.normpath(f'{rootdir}/{filename_to_filepath(filename)}'))}
+            for _, filename in sorted(files.items())]
+
 
 def get_file_list(start_date, end_date, data_rate='fast', data_level='l2',
-                  datatype=None, instrument='fpi', sc_id='mms1'):
+                  datatype=None, instrument='fpi', sc_id='mms1',
+                  rootdir=None, ttl=_FILE_LIST_TTL, offline=False):
     """
     Get a list of files from the MMS Science Data center. For a full list of
     the possible parameters, look at "Query Parameters" on the MMS Science
     Data center, "How to get data" page:
     [https://lasp.colorado.edu/mms/sdc/public/about/how-to/](https://lasp.colorado.edu/mms/sdc/public/about/how-to/)
 
+    If rootdir is given the file lists are cached, per query and day, in
+    `{rootdir}/.file_lists` and only days missing from the cache, or older
+    than ttl, are requested from the Science Data center. In offline mode no
+    requests are made, days not in the cache are instead listed from the
+    files stored in rootdir.
+
     Args:
         start_date (string): The start date for files, format YYYY-MM-DD.
         end_date (string): The end date for files, format YYYY-MM-DD.
@@ -59,26 +158,76 @@ def get_file_list(start_date, end_date, data_rate='fast', data_level='l2',
         datatype (string): The datatype (not always used).
         instrument (string): The instrument onboard mms.
         sc_id (string): The spacecraft id, mms1, mms2, mms3 or mms4.
+        rootdir (string): Root directory of the data storage, used for
+            caching the file lists.
+        ttl (float): The time, in seconds, a cached file list is valid.
+        offline (bool): Only use the cache and the local files.
 
     Returns:
         A list of files.
     """
-    url = f'{_MMS_DATA_BASE_URL}file_info/science?'
-    url += f'start_date={start_date}&end_date={end_date}&sc_id={sc_id}'
-    url += f'&instrument_id={instrument}'
-    url += f'&data_rate_mode={data_rate}&data_level={data_level}'
-    if datatype is not None:
-        url += f'&descriptor={datatype}'
+    query = (data_rate, data_level, datatype, instrument, sc_id)
+    if rootdir is None:
+        if offline:
+            raise ValueError('A rootdir is required in offline mode')
+        return _query_file_list(start_date, end_date, *query)
 
-    with requests.Session() as session:
-        r = session.get(url)
-        files = r.json()['files']
-        r.close()
+    start = dt.datetime.strptime(start_date, '%Y-%m-%d')
+    days = [(start + dt.timedelta(days=i)).strftime('%Y-%m-%d')
+            for i in range((dt.datetime.strptime(end_date, '%Y-%m-%d') -
+                            start).days)]
 
-    return files
+    cache_filepath = f'{rootdir}/{_FILE_LIST_DIR}/' + \
+        '_'.join(str(q) for q in query) + '.json'
+    cache = {}
+    if path.isfile(cache_filepath):
+        with open(cache_filepath, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+
+    now = time.time()
+    missing = [day for day in days
+               if day not in cache or
+               (not offline and now - cache[day]['time'] > ttl)]
+
+    if missing and offline:
+        files = _local_file_list(rootdir, missing, *query)
+        for day in missing:
+            cache[day] = {'files': [f for f in files
+                                    if _file_day(f['file_name']) == day]}
+
+    elif missing:
+        # Request all the missing days at once and split them up per day
+        end = dt.datetime.strptime(missing[-1], '%Y-%m-%d') + \
+            dt.timedelta(days=1)
+        files = _query_file_list(missing[0], end.strftime('%Y-%m-%d'),
+                                 *query)
 
+        queried = [day for day in days if missing[0] <= day <= missing[-1]]
+        for day in queried:
+            cache[day] = {'time': now, 'files': []}
+        for f in files:
+            day = _file_day(f['file_name'])
+            # Files outside of the queried days (e.g. starting the day
+            # before) are stored with the first day.
+            day = day if day in queried else queried[0]
+            cache[day]['files'].append(f)
 
-def download_cdf_files(rootdir, cdf_filepaths, session=None):
+        makedirs(path.dirname(cache_filepath), exist_ok=True)
+        tmp_filepath = f'{cache_filepath}.{getpid()}.tmp'
+        with open(tmp_filepath, 'w', encoding='utf-8') as f:
+            json.dump(cache, f)
+        replace(tmp_filepath, cache_filepath)
+
+    files = {}
+    for day in days:
+        for f in cache[day]['files']:
+            files[f['file_name']] = f
+
+    return sorted(files.values(), key=lambda f: (f['file_name'].split('_')[-2],
+                                                 f['file_name']))
+
+
+def download_cdf_files(rootdir, cdf_filepaths, session=None, workers=1):
     """
     Download CDF files from the MMS Science Data Center based on a file list.
 
@@ -87,16 +236,14 @@ def download_cdf_files(rootdir, cdf_filepaths, session=None):
         cdf_filepaths (list): The paths to store the files (including
             filename). The filename have to be the same as the file to
             download.
-        session (Object): The request session to use, if one exists.
+        session (Object): The request session to use, if one exists. Only
+            used when downloading one file at the time.
+        workers (int): The number of files to download concurrently.
     """
-    close_session = False
-    if session is None:
-        close_session = True
-        session = requests.Session()
-
     t_cnt = len(cdf_filepaths)
     rootdir = rootdir[:-1] if rootdir[-1] == '/' else rootdir
 
+    downloads = []
     for cnt, filepath in enumerate(cdf_filepaths, 1):
         dirpath, filename = path.split(filepath)
         makedirs(f'{rootdir}/{dirpath}', exist_ok=True)
@@ -105,7 +252,23 @@ def download_cdf_files(rootdir, cdf_filepaths, session=None):
         if path.isfile(filepath):
             print(f'({cnt}/{t_cnt}): File {filename} exists, skipping.')
         else:
-            print(f'({cnt}/{t_cnt}): Downloading file {filename}')
-            download_file_with_status(url_file, filepath, session)
+            downloads.append((cnt, filename, url_file, filepath))
+
+    if workers > 1:
+        print(f'Downloading {len(downloads)} files')
+        download_files([(url_file, filepath)
+                        for _, _, url_file, filepath in downloads],
+                       workers=workers)
+        return
+
+    close_session = False
+    if session is None:
+        close_session = True
+        session = requests.Session()
+
+    for cnt, filename, url_file, filepath in downloads:
+        print(f'({cnt}/{t_cnt}): Downloading file {filename}')
+        download_file_with_status(url_file, filepath, session)
+
     if close_session:
         session.close()
@@ -0,0 +1,140 @@
+"""
+Background prefetching of data read from files.
+"""
+from os import getpid
+import threading
+
+
+class Prefetcher():
+    """
+    Read values in a background thread before they are needed.
+
+    The caller requests the keys it will need next, and the values are read
+    in order in a background thread. At most `depth` values are requested or
+    read but not yet taken with get(), so the memory used is bounded. Values
+    that are no longer requested are dropped. The thread is restarted in
+    processes forked from the process that started it.
+
+    Examples:
+        >>> from spacephyml.utils.prefetch import Prefetcher
+        >>> prefetcher = Prefetcher(read_file, depth=2)
+        >>> prefetcher.request(['file1.cdf', 'file2.cdf'])
+        >>> data = prefetcher.get('file1.cdf')
+
+    Args:
+        read (callable): Function reading the value of a key.
+        depth (int): The largest number of values to read ahead.
+    """
+
+    def __init__(self, read, depth=2):
+        self.read = read
+        self.depth = depth
+        self._reset()
+
+    def _reset(self):
+        self._pid = getpid()
+        self._cond = threading.Condition()
+        self._wanted = []
+        self._ready = {}
+        self._loading = None
+        self._closed = False
+        self._thread = None
+
+    def __getstate__(self):
+        return {'read': self.read, 'depth': self.depth}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._reset()
+
+    def request(self, keys):
+        """
+        Set the keys to read next, replacing the earlier requests.
+
+        Args:
+            keys (list): The keys, in the order they will be needed. Only the
+                first `depth` keys are read.
+        """
+        if self._pid != getpid():
+            self._reset()
+
+        keys = list(keys)[:self.depth]
+        with self._cond:
+            self._wanted = keys
+            for key in list(self._ready):
+                if key not in keys:
+                    del self._ready[key]
+
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    def get(self, key):
+        """
+        Take a prefetched value, waiting for it if it is requested but not
+        yet read.
+
+        Args:
+            key (hashable): The key of the value.
+
+        Returns:
+            The value, or None if the key was not prefetched.
+        """
+        if self._pid != getpid():
+            return None
+
+        with self._cond:
+            while self._loading == key or \
+                    (key in self._wanted and key not in self._ready):
+                self._cond.wait()
+
+            if key in self._wanted:
+                self._wanted.remove(key)
+            return self._ready.pop(key, None)
+
+    def close(self):
+        """
+        Stop the background thread and drop the prefetched values.
+        """
+        with self._cond:
+            self._closed = True
+            self._wanted = []
+            self._ready.clear()
+            self._cond.notify_all()
+
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._closed = False
+
+    def _next_key(self):
+        for key in self._wanted:
+            if key not in self._ready:
+                return key
+        return None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed and self._next_key() is None:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                key = self._loading = self._next_key()
+
+            # Failed reads are left to the caller, which gets the error when
+            # reading the value itself.
+            try:
+                value = self.read(key)
+            except Exception:  # pylint: disable=broad-exception-caught
+                value = None
+
+            with self._cond:
+                self._loading = None
+                if key in self._wanted:
+                    if value is None:
+                        self._wanted.remove(key)
+                    else:
+                        self._ready[key] = value
+                self._cond.notify_all()
@@ -0,0 +1,128 @@
+"""
+Streaming statistics of datasets.
+"""
+import numpy as np
+
+
+class RunningStats():
+    """
+    Mean, variance, min and max computed in one pass over batches of
+    samples, using Welford's algorithm generalized to batches.
+
+    The statistics are either global or per channel, along one axis of the
+    samples. Accumulators for different parts of a dataset, e.g. computed by
+    different processes or for different files, can be combined with
+    merge(). Values that are not finite (NaN or inf) are skipped.
+
+    Examples:
+        >>> import numpy as np
+        >>> from spacephyml.utils.stats import RunningStats
+        >>> stats = RunningStats(channel_axis=-1)
+        >>> stats.update(np.random.rand(256, 32, 16, 32))
+        >>> mean, std = stats.mean, stats.std
+
+    Args:
+        channel_axis (int): Axis of the samples with one channel per entry,
+            has to be negative. None for global statistics.
+    """
+
+    def __init__(self, channel_axis=None):
+        if channel_axis is not None and channel_axis >= 0:
+            raise ValueError(f'Invalid channel_axis {channel_axis}, has to ' +
+                             'be negative')
+
+        self.channel_axis = channel_axis
+        self.count = 0
+        self._mean = 0.0
+        self._m2 = 0.0
+        self._min = np.inf
+        self._max = -np.inf
+
+    def update(self, batch):
+        """
+        Add a batch of samples.
+
+        Args:
+            batch (array): The samples, stacked along the first axis.
+        """
+        x = np.asarray(batch, dtype=np.float64)
+        axes = tuple(range(x.ndim))
+        if self.channel_axis is not None:
+            axes = tuple(a for a in axes if a != x.ndim + self.channel_axis)
+
+        valid = np.isfinite(x)
+        count = valid.sum(axis=axes, keepdims=True)
+        mean = np.where(valid, x, 0).sum(axis=axes, keepdims=True) / \
+            np.maximum(count, 1)
+        m2 = np.square(np.where(valid, x - mean, 0)).sum(axis=axes,
+                                                          keepdims=True)
+        low = np.where(valid, x, np.inf).min(axis=axes, keepdims=True)
+        high = np.where(valid, x, -np.inf).max(axis=axes, keepdims=True)
+
+        # Drop the batch axis, keeping the dimensions for broadcasting
+        # against samples
+        self._add(*(v[0] for v in (count, mean, m2, low, high)))
+
+    def merge(self, other):
+        """
+        Add the samples of another accumulator.
+
+        Args:
+            other (RunningStats): Statistics with the same channel axis.
+        """
+        if other.channel_axis != self.channel_axis:
+            raise ValueError('Can not merge statistics with different ' +
+                             'channel axes')
+        self._add(other.count, other._mean, other._m2,
+                  other._min, other._max)
+
+    def _add(self, count, mean, m2, low, high):
+        total = self.count + count
+        delta = mean - self._mean
+        fraction = np.where(total > 0, count / np.maximum(total, 1), 0)
+
+        self._mean = self._mean + delta * fraction
+        self._m2 = self._m2 + m2 + delta ** 2 * self.count * fraction
+        self._min = np.minimum(self._min, low)
+        self._max = np.maximum(self._max, high)
+        self.count = total
+
+    def _value(self, value):
+        if self.channel_axis is None:
+            return float(np.asarray(value).reshape(-1)[0])
+        return np.asarray(value)
+
+    @property
+    def mean(self):
+        """
+        The mean.
+        """
+        return self._value(self._mean)
+
+    @property
+    def var(self):
+        """
+        The (population) variance.
+        """
+        return self._value(self._m2 / np.maximum(self.count, 1))
+
+    @property
+    def std(self):
+        """
+        The (population) standard deviation.
+        """
+        return self._value(np.sqrt(self._m2 / np.maximum(self.count, 1)))
+
+    @property
+    def min(self):
+        """
+        The smallest value.
+        """
+        return self._value(self._min)
+
+    @property
+    def max(self):
+        """
+        The largest value.
+        """
+        return self._value(self._max)
@@ -0,0 +1,120 @@
+"""
+Utils for verifying the integrity of local data files.
+"""
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from os import path, replace, stat, getpid
+import cdflib
+
+# Manifest file (relative to the data root) with the verified files
+_MANIFEST_FILE = '.verified.json'
+
+
+def _check_cdf_file(filepath, variables):
+    """
+    Check that a CDF file can be read.
+
+    The header is parsed, the MD5 checksum is validated if the file has one,
+    and the last record of each variable is read to detect truncated files.
+
+    Returns:
+        None if the file is valid, else a string with the problem.
+    """
+    try:
+        cdf_file = cdflib.cdfread.CDF(filepath, validate=True)
+        info = cdf_file.cdf_info()
+        names = set(info.zVariables) | set(info.rVariables)
+        for var in variables:
+            if var not in names:
+                return f'Varible {var} is missing'
+
+            last = cdf_file.varinq(var).Last_Rec
+            if last >= 0:
+                cdf_file.varget(var, startrec=last, endrec=last)
+    except Exception as err:  # pylint: disable=broad-exception-caught
+        return f'{type(err).__name__}: {err}'
+
+    return None
+
+
+def _read_manifest(manifest_path):
+    if not path.isfile(manifest_path):
+        return {}
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except ValueError:
+        return {}
+
+
+def _write_manifest(manifest_path, manifest):
+    tmp_path = f'{manifest_path}.{getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    replace(tmp_path, manifest_path)
+
+
+def verify_cdf_files(rootdir, files, workers=4):
+    """
+    Verify local CDF files in parallel.
+
+    Each file is parsed, checked for the expected variables and, if the file
+    has one, checked against its MD5 checksum. The verified files are stored
+    in a manifest in the root directory, keyed by the size and modification
+    time of each file, so unchanged files are only verified once.
+
+    Examples:
+        >>> from spacephyml.utils.verify import verify_cdf_files
+        >>> corrupt = verify_cdf_files('./mms', {
+        ...     'mms1/fpi/fast/l2/dis-dist/2017/11/file.cdf':
+        ...         ['mms1_dis_dist_fast']})
+
+    Args:
+        rootdir (string): The root directory of the files.
+        files (dict): The files (relative to rootdir) to verify, with the
+            list of variables that have to be present in each file.
+        workers (int): The number of files to verify concurrently.
+
+    Returns:
+        A dictionary with the files failing verification and the reason,
+        empty if all files are valid.
+    """
+    manifest_path = f'{rootdir}/{_MANIFEST_FILE}'
+    manifest = _read_manifest(manifest_path)
+
+    todo = {}
+    for filepath, variables in files.items():
+        file_stat = stat(f'{rootdir}/{filepath}')
+        entry = manifest.get(filepath, {})
+        if entry.get('size') == file_stat.st_size and \
+                entry.get('mtime_ns') == file_stat.st_mtime_ns:
+            variables = set(variables) - set(entry['variables'])
+            if not variables:
+                continue
+            variables = set(entry['variables']) | variables
+        todo[filepath] = (sorted(variables), file_stat)
+
+    if not todo:
+        return {}
+
+    print(f'Verifying {len(todo)} data files')
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(
+            lambda item: _check_cdf_file(f'{rootdir}/{item[0]}',
+                                         item[1][0]),
+            todo.items()))
+
+    corrupt = {}
+    for (filepath, (variables, file_stat)), problem in zip(todo.items(),
+                                                           results):
+        if problem is None:
+            manifest[filepath] = {'size': file_stat.st_size,
+                                  'mtime_ns': file_stat.st_mtime_ns,
+                                  'variables': variables}
+        else:
+            manifest.pop(filepath, None)
+            corrupt[filepath] = problem
+
+    _write_manifest(manifest_path, manifest)
+    return corrupt
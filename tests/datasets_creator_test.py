@@ -0,0 +1,245 @@
+import datetime as dt
+from os import path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from spacephyml.datasets import creator
+from spacephyml.utils import mms, pandas_read_file
+
+
+def test_match_epochs_closest():
+    file_epochs = np.array([0, 4_500_000_000, 9_000_000_000, 30_000_000_000])
+    epochs = np.array([100, 4_400_000_000, 19_000_000_000, 31_000_000_000])
+
+    index, valid = creator._match_epochs(file_epochs, epochs)
+
+    assert list(index) == [0, 1, 2, 3]
+    assert list(valid) == [True, True, False, True]
+
+
+def test_match_epochs_brute_force():
+    rng = np.random.default_rng(42)
+    file_epochs = np.sort(rng.integers(0, 10**12, 500))
+    epochs = rng.integers(0, 10**12, 200)
+
+    index, _ = creator._match_epochs(file_epochs, epochs)
+
+    for j, epoch in enumerate(epochs):
+        assert index[j] == np.abs(file_epochs - epoch).argmin()
+
+
+def test_match_epochs_tolerance():
+    file_epochs = np.array([0, 10_000_000_000])
+    epochs = np.array([2_000_000_000])
+
+    _, valid = creator._match_epochs(file_epochs, epochs, tolerance=1)
+    assert not valid[0]
+
+    _, valid = creator._match_epochs(file_epochs, epochs, tolerance=2)
+    assert valid[0]
+
+
+def test_epoch_index_shared_between_vars(mocker):
+    files = np.array(['a', 'b'], dtype=object)
+    file_index = np.array([0, 0, 1, 1])
+    file_epochs = np.array([0, 4_500_000_000, 9_000_000_000, 13_500_000_000])
+    load = mocker.patch('spacephyml.datasets.creator._load_file_epochs',
+                        return_value=(files, file_index, file_epochs))
+
+    index = creator._EpochIndex(None)
+    epochs = pd.Series([100, 9_000_000_100, 60_000_000_000])
+    files_a, epochs_a = index.match('mms1_dis_bulkv_gse_fast', epochs)
+    files_b, epochs_b = index.match('mms1_dis_numberdensity_fast',
+                                    epochs.iloc[:2])
+
+    load.assert_called_once()
+    assert files_a == ['a', 'b', 'b']
+    assert list(epochs_a) == [0, 9_000_000_000, 0]
+    assert files_b == files_a[:2]
+    assert list(epochs_b) == list(epochs_a[:2])
+
+
+def test_missing_intervals():
+    day = [dt.datetime(2017, 11, d) for d in range(1, 8)]
+    covered = [[day[1], day[2]], [day[3], day[4]]]
+
+    assert creator._missing_intervals(covered, [day[0], day[5]]) == \
+        [[day[0], day[1]], [day[2], day[3]], [day[4], day[5]]]
+    assert creator._missing_intervals(covered, [day[1], day[2]]) == []
+    assert creator._merge_intervals(covered + [[day[2], day[3]]]) == \
+        [[day[1], day[4]]]
+
+
+def test_write_parquet_partitioned(tmp_path):
+    time = pd.date_range('2017-11-30 12:00', '2017-12-01 12:00', freq='1h')
+    dataset = pd.DataFrame({'label': np.arange(len(time)),
+                            'Time': time,
+                            'file 0': ['a'] * len(time)})
+    filepath = str(tmp_path / 'dataset.parquet')
+
+    creator._write_dataset(dataset, filepath, {'label_source': 'Unlabeled'})
+
+    assert sorted(p.name for p in (tmp_path / 'dataset.parquet').iterdir()) \
+        == ['month=2017-11', 'month=2017-12']
+    assert creator._read_metadata(filepath) == {'label_source': 'Unlabeled'}
+
+    part = pandas_read_file(filepath, columns=['label'],
+                            trange=['2017-12-01', '2017-12-01/06:00:00'])
+    assert list(part.columns) == ['label']
+    assert list(part['label']) == list(range(12, 18))
+
+
+def _synthetic_files(mocker):
+    """
+    Synthetic FPI (two hour files) and FGM survey (daily files) data.
+    """
+    files = {'mms1_dis_numberdensity_fast': [
+                 f'mms1_fpi_fast_l2_dis-moms_20171101{h:02}0000_v3.4.0.cdf'
+                 for h in range(0, 24, 2)] + [
+                 f'mms1_fpi_fast_l2_dis-moms_20171102{h:02}0000_v3.4.0.cdf'
+                 for h in range(0, 24, 2)],
+             'mms1_fgm_b_gsm_srvy_l2': [
+                 'mms1_fgm_srvy_l2_20171101_v5.117.0.cdf',
+                 'mms1_fgm_srvy_l2_20171102_v5.117.0.cdf']}
+
+    def read_var_file(filename, var):
+        start = mms._file_start(filename)
+        length = pd.Timedelta('1D' if 'fgm' in filename else '2h')
+        step = pd.Timedelta('16s' if 'fgm' in filename else '4.5s')
+        time = pd.date_range(start, start + length - step, freq=step)
+        epochs = (time - pd.Timestamp('2000-01-01 12:00')).as_unit('ns')
+        columns = len(creator._VAR_TO_FILE_INFO[var]['mapping'])
+        rng = np.random.default_rng(int(start.timestamp()) + columns)
+        return epochs.asi8, rng.normal(size=(len(time), columns))
+
+    mocker.patch('spacephyml.datasets.creator._get_data_files',
+                 side_effect=lambda trange, var, offline: files[var])
+    mocker.patch('spacephyml.datasets.creator._read_var_file',
+                 side_effect=read_var_file)
+
+
+def test_resample_chunked(mocker):
+    _synthetic_files(mocker)
+    trange = ['2017-11-01', '2017-11-02/12:00:00']
+    var_list = ['mms1_dis_numberdensity_fast', 'mms1_fgm_b_gsm_srvy_l2']
+
+    full = creator._get_unlabeled_dataset(list(trange), var_list,
+                                          resample='1min')
+    for chunk in ['1D', '5h']:
+        chunked = creator._get_unlabeled_dataset(
+            list(trange), var_list, resample='1min', chunk=chunk)
+        pd.testing.assert_frame_equal(chunked, full, check_freq=False)
+    assert len(full.index) == 36 * 60
+    assert list(full.columns) == ['Number Density', 'Bx', 'By', 'Bz', 'label']
+
+
+def _fake_get_dataset(label_source, trange, resample=None, clean=True,
+                      samples=0, var_list=None, tolerance=4.5, offline=False,
+                      chunk=None):
+    """
+    Hourly samples in trange, including both ends.
+    """
+    start, end = (pd.Timestamp(t.replace('/', ' ')) for t in trange)
+    time = pd.date_range(start, end, freq='1h')
+    if resample is not None:
+        return pd.DataFrame({'Bx': time.hour * 1.5, 'label': -1},
+                            index=time)
+
+    epochs = (time - pd.Timestamp('2000-01-01 12:00')).as_unit('ns').asi8
+    return pd.DataFrame({'label': time.hour % 3, 'Time': time,
+                         'epoch': epochs,
+                         'file 0': [f'file_{t:%Y%m%d}.cdf' for t in time]})
+
+
+@pytest.mark.parametrize('fileformat', ['csv', 'feather', 'parquet'])
+@pytest.mark.parametrize('resample', [None, '1h'])
+def test_append_dataset(tmp_path, mocker, fileformat, resample):
+    mocker.patch('spacephyml.datasets.creator.get_dataset', autospec=True,
+                 side_effect=_fake_get_dataset)
+    options = {'label_source': 'Unlabeled', 'resample': resample,
+               'clean': False}
+    full = str(tmp_path / f'full.{fileformat}')
+    appended = str(tmp_path / f'appended.{fileformat}')
+
+    creator.create_dataset(full, ['2017-11-30', '2017-12-01/12:00:00'],
+                           **options)
+    creator.create_dataset(appended,
+                           ['2017-11-30/06:00:00', '2017-11-30/18:00:00'],
+                           **options)
+    # The boundaries of the added parts are already in the dataset
+    creator.create_dataset(appended, ['2017-11-30', '2017-12-01/06:00:00'],
+                           append=True, **options)
+    creator.create_dataset(appended, ['2017-11-30', '2017-12-01/12:00:00'],
+                           append=True, **options)
+
+    pd.testing.assert_frame_equal(pandas_read_file(appended),
+                                  pandas_read_file(full), check_freq=False)
+    assert len(pandas_read_file(appended)) == 37
+    assert creator._read_metadata(appended) == {
+        'trange': [['2017-11-30/00:00:00', '2017-12-01/12:00:00']],
+        'label_source': 'Unlabeled', 'var_list': ['mms1_dis_dist_fast'],
+        'resample': resample, 'clean': False, 'tolerance': 4.5}
+
+    # The time range is covered, so nothing is added
+    calls = creator.get_dataset.call_count
+    creator.create_dataset(appended, ['2017-11-30', '2017-12-01'],
+                           append=True, **options)
+    assert creator.get_dataset.call_count == calls
+
+    with pytest.raises(ValueError):
+        creator.create_dataset(appended, ['2017-11-30', '2017-12-02'],
+                               append=True, **{**options, 'clean': True})
+    with pytest.raises(ValueError):
+        creator.create_dataset(appended, ['2017-11-30', '2017-12-02'],
+                               append=True, tolerance=1, **options)
+    assert creator.get_dataset.call_count == calls
+
+
+def test_materialize_dataset(tmp_path, mocker):
+    var = 'mms1_dis_numberdensity_fast'
+    files = ['mms1_fpi_fast_l2_dis-moms_20171130220000_v3.4.0.cdf',
+             'mms1_fpi_fast_l2_dis-moms_20171201000000_v3.4.0.cdf']
+    file_epochs = {f: np.arange(10) * 1000 + i for i, f in enumerate(files)}
+
+    def read_cdf_file(filepath, variables, records=None):
+        epochs = file_epochs[path.basename(filepath)]
+        return {'var': np.stack([epochs] * 2, axis=1)[records]}
+
+    mocker.patch('spacephyml.datasets.creator.read_cdf_epochs',
+                 side_effect=lambda rootdir, filepath:
+                 file_epochs[path.basename(filepath)])
+    mocker.patch('spacephyml.datasets.creator.read_cdf_file',
+                 side_effect=read_cdf_file)
+    missing = mocker.patch('spacephyml.datasets.creator.missing_files',
+                           return_value=[])
+
+    # The rows of the files are interleaved
+    epochs = [3001, 5000, 1, 9000, 7001]
+    dataset = pd.DataFrame({'label': 0,
+                            'file 0': [files[e % 2] for e in epochs],
+                            'var_name 0': var, 'epoch 0': epochs})
+    dataset_path = str(tmp_path / 'dataset.csv')
+    dataset.to_csv(dataset_path)
+
+    creator._materialize_dataset(dataset_path, offline=True)
+    samples = np.load(f'{dataset_path}.samples/0_{var}.npy')
+    assert samples.tolist() == [[e, e] for e in epochs]
+
+    # Materializing again replaces the store
+    creator._materialize_dataset(dataset_path, offline=True)
+    assert [p.name for p in tmp_path.iterdir()
+            if p.name.startswith('dataset.csv.')] == ['dataset.csv.samples']
+
+    # Failed reads do not leave a partial store behind
+    mocker.patch('spacephyml.datasets.creator.read_cdf_file',
+                 side_effect=OSError)
+    with pytest.raises(OSError):
+        creator._materialize_dataset(dataset_path, offline=True)
+    assert [p.name for p in tmp_path.iterdir()
+            if p.name.startswith('dataset.csv.')] == ['dataset.csv.samples']
+
+    missing.return_value = [mms.filename_to_filepath(files[0])]
+    with pytest.raises(ValueError):
+        creator._materialize_dataset(dataset_path, offline=True)
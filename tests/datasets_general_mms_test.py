@@ -0,0 +1,249 @@
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+from cdflib.cdfwrite import CDF
+from torch.utils.data import DataLoader
+
+from spacephyml.datasets.general.mms import (ExternalMMSData,
+                                             MaterializedMMSData)
+from spacephyml.transforms import ZScoreNorm
+
+
+def write_cdf(filepath, epochs, values):
+    filepath.parent.mkdir(parents=True, exist_ok=True)
+    cdf_file = CDF(str(filepath), cdf_spec={'rDim_sizes': []})
+    cdf_file.write_var({'Variable': 'Epoch', 'Data_Type': 33,
+                        'Num_Elements': 1, 'Rec_Vary': True,
+                        'Dim_Sizes': [], 'Var_Type': 'zVariable'},
+                       var_data=epochs)
+    cdf_file.write_var({'Variable': 'mms1_dis_numberdensity_fast',
+                        'Data_Type': 21, 'Num_Elements': 1, 'Rec_Vary': True,
+                        'Dim_Sizes': [], 'Var_Type': 'zVariable'},
+                       var_data=values)
+    cdf_file.close()
+
+
+@pytest.fixture
+def external(tmp_path):
+    files = ['mms1_fpi_fast_l2_dis-moms_20171103000000_v3.4.0.cdf',
+             'mms1_fpi_fast_l2_dis-moms_20171103020000_v3.4.0.cdf']
+    for i, filename in enumerate(files):
+        write_cdf(tmp_path / 'mms/mms1/fpi/fast/l2/dis-moms/2017/11' /
+                  filename,
+                  np.arange(5, dtype=np.int64) * 10 + i * 100,
+                  np.arange(5, dtype=np.float32) + i * 10)
+
+    dataset = pd.DataFrame({'label': [0, 1, 2, 3],
+                            'epoch': [1, 2, 3, 4],
+                            'epoch 0': [40, 100, 0, 120],
+                            'file 0': [files[0], files[1], files[0],
+                                       files[1]],
+                            'var_name 0': 'mms1_dis_numberdensity_fast'})
+    dataset.to_csv(tmp_path / 'dataset.csv')
+    return tmp_path, files
+
+
+@pytest.mark.parametrize('cache', [True, False])
+def test_external_mms_data(external, cache):
+    tmp_path, _ = external
+    dataset = ExternalMMSData(str(tmp_path / 'dataset.csv'),
+                              rootdir=str(tmp_path), cache=cache)
+
+    assert len(dataset) == 4
+    assert [list(dataset[i]) for i in range(4)] == \
+        [[4, 0, 1], [10, 1, 2], [0, 2, 3], [12, 3, 4]]
+
+    # The dataset table is only read when used
+    assert dataset._dataset is None
+    assert list(dataset.dataset['label']) == [0, 1, 2, 3]
+
+
+def test_external_mms_data_getitems(external):
+    tmp_path, _ = external
+    dataset = ExternalMMSData(str(tmp_path / 'dataset.csv'),
+                              rootdir=str(tmp_path),
+                              transform=ZScoreNorm(1, 2))
+
+    assert [list(s) for s in dataset.__getitems__([3, 0, 1])] == \
+        [list(dataset[i]) for i in [3, 0, 1]]
+
+    loader = DataLoader(dataset, batch_size=3)
+    data, label, epoch = next(iter(loader))
+    assert data.tolist() == [1.5, 4.5, -0.5]
+    assert label.tolist() == [0, 1, 2]
+
+
+def test_external_mms_data_cache_size(external, mocker):
+    tmp_path, files = external
+    # Room for the data of one file
+    dataset = ExternalMMSData(str(tmp_path / 'dataset.csv'),
+                              rootdir=str(tmp_path), cache_size=20)
+    for i in range(4):
+        dataset[i]
+
+    assert dataset.data.stats()['misses'] == 4
+    assert dataset.data.stats()['evictions'] == 3
+
+    # Cache hits do not store the data again
+    dataset = ExternalMMSData(str(tmp_path / 'dataset.csv'),
+                              rootdir=str(tmp_path))
+    put = mocker.spy(dataset.data, 'put')
+    for i in range(4):
+        dataset[i]
+    assert dataset.data.stats()['hits'] == 2
+    assert put.call_count == 2
+
+    dataset = ExternalMMSData(str(tmp_path / 'dataset.csv'),
+                              rootdir=str(tmp_path), cache_size=20,
+                              cache_pinned=1)
+    for i in range(4):
+        dataset[i]
+
+    # The pinned file is kept next to the other one
+    assert dataset.data.stats()['hits'] == 2
+    assert dataset.data.stats()['evictions'] == 0
+    assert (files[1], 'mms1_dis_numberdensity_fast') in dataset.data
+
+
+def test_external_mms_data_shared_cache(external):
+    tmp_path, _ = external
+    dataset = ExternalMMSData(str(tmp_path / 'dataset.csv'),
+                              rootdir=str(tmp_path), shared_cache=True)
+    loader = DataLoader(dataset, batch_size=1, num_workers=2)
+
+    assert [[int(v) for v in batch] for batch in loader] == \
+        [[4, 0, 1], [10, 1, 2], [0, 2, 3], [12, 3, 4]]
+    assert len(list((tmp_path / '.shared_cache').glob('*.npy'))) == 2
+
+
+def test_external_mms_data_prefetch(external, mocker):
+    tmp_path, _ = external
+    read = mocker.spy(ExternalMMSData, '_read_file')
+    dataset = ExternalMMSData(str(tmp_path / 'dataset.csv'),
+                              rootdir=str(tmp_path), prefetch=1)
+
+    assert [list(dataset[i]) for i in range(4)] == \
+        [[4, 0, 1], [10, 1, 2], [0, 2, 3], [12, 3, 4]]
+    # Both files are read once, the second one by the background thread
+    assert read.call_count == 2
+    assert dataset.data.stats()['misses'] == 2
+    dataset.prefetchers[0].close()
+
+    with pytest.raises(ValueError):
+        ExternalMMSData(str(tmp_path / 'dataset.csv'), rootdir=str(tmp_path),
+                        cache=False, prefetch=1)
+
+
+def test_external_mms_data_verify(external, mocker):
+    tmp_path, files = external
+    filepath = (tmp_path / 'mms/mms1/fpi/fast/l2/dis-moms/2017/11' /
+                files[1])
+    data = filepath.read_bytes()
+    filepath.write_bytes(data[:len(data) // 2])
+
+    def download(rootdir, cdf_filepaths, workers):
+        assert len(cdf_filepaths) == 1
+        assert cdf_filepaths[0].endswith(files[1])
+        filepath.write_bytes(data)
+
+    download = mocker.patch('spacephyml.utils.mms.download_cdf_files',
+                            side_effect=download)
+    dataset = ExternalMMSData(str(tmp_path / 'dataset.csv'),
+                              rootdir=str(tmp_path), verify=True)
+    download.assert_called_once()
+    assert [list(dataset[i]) for i in range(4)] == \
+        [[4, 0, 1], [10, 1, 2], [0, 2, 3], [12, 3, 4]]
+
+
+def test_external_mms_data_transform_cache(external, mocker):
+    tmp_path, _ = external
+
+    def load(transform):
+        return ExternalMMSData(str(tmp_path / 'dataset.csv'),
+                               rootdir=str(tmp_path), transform=transform,
+                               transform_cache=True)
+
+    dataset = load(ZScoreNorm(1, 2))
+    expected = [[1.5, 0, 1], [4.5, 1, 2], [-0.5, 2, 3], [5.5, 3, 4]]
+    assert [list(dataset[i]) for i in range(4)] == expected
+
+    # A new dataset with the same transform only reads the stored samples
+    gather = mocker.spy(ExternalMMSData, '_gather')
+    dataset = load(ZScoreNorm(1, 2))
+    assert [list(s) for s in dataset.__getitems__([0, 1, 2, 3])] == expected
+    gather.assert_not_called()
+
+    # A changed transform uses a new store
+    dataset = load(ZScoreNorm(0, 1))
+    assert list(dataset[0]) == [4, 0, 1]
+    assert len(list((tmp_path / '.transform_cache').iterdir())) == 2
+
+
+def test_external_mms_data_spawn(external):
+    tmp_path, _ = external
+    dataset = ExternalMMSData(str(tmp_path / 'dataset.csv'),
+                              rootdir=str(tmp_path), cache_size=100,
+                              prefetch=1)
+    dataset[0]
+
+    copy = pickle.loads(pickle.dumps(dataset))
+    assert len(copy.data) == 0
+    assert list(copy[1]) == [10, 1, 2]
+
+    loader = DataLoader(dataset, batch_size=2, num_workers=1,
+                        multiprocessing_context='spawn')
+    data, label, _ = next(iter(loader))
+    assert data.tolist() == [4, 10]
+
+
+@pytest.fixture
+def materialized(tmp_path):
+    time = pd.date_range('2017-11-03', periods=6, freq='1h')
+    dataset = pd.DataFrame({'label': [0, 1, 2, 0, 1, 2],
+                            'epoch': np.arange(6) * 10,
+                            'Time': time,
+                            'epoch 0': np.arange(6) * 10,
+                            'file 0': 'file.cdf',
+                            'var_name 0': 'mms1_dis_dist_fast'})
+    dataset_path = str(tmp_path / 'dataset.csv')
+    dataset.to_csv(dataset_path)
+
+    (tmp_path / 'dataset.csv.samples').mkdir()
+    samples = np.arange(6 * 2 * 3, dtype=np.float32).reshape(6, 2, 3)
+    np.save(tmp_path / 'dataset.csv.samples' / '0_mms1_dis_dist_fast.npy',
+            samples)
+    return dataset_path, samples
+
+
+def test_materialized_mms_data(materialized):
+    dataset_path, samples = materialized
+    dataset = MaterializedMMSData(dataset_path)
+
+    assert len(dataset) == 6
+    data, label, epoch = dataset[4]
+    assert np.array_equal(data, samples[4])
+    assert label == 1
+    assert epoch == 40
+
+    # Samples are copied from the store
+    data[:] = 0
+    assert np.array_equal(dataset[4][0], samples[4])
+
+
+def test_materialized_mms_data_trange(materialized):
+    dataset_path, samples = materialized
+    dataset = MaterializedMMSData(dataset_path, return_epoch=False,
+                                  trange=['2017-11-03/02:00:00',
+                                          '2017-11-03/04:00:00'])
+
+    assert len(dataset) == 2
+    data, label = dataset[1]
+    assert np.array_equal(data, samples[3])
+    assert label == 0
+
+    batch = dataset.__getitems__([1, 0])
+    assert np.array_equal(batch[0][0], samples[3])
+    assert np.array_equal(batch[1][0], samples[2])
+    assert [label for _, label in batch] == [0, 2]
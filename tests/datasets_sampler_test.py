@@ -0,0 +1,70 @@
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+from spacephyml.datasets.sampler import FileLocalitySampler
+
+
+def make_dataset(files=10, samples=20):
+    return SimpleNamespace(dataset=pd.DataFrame(
+        {'file 0': [f'file_{i % files}' for i in range(files * samples)]}))
+
+
+def test_file_locality_sampler_window():
+    dataset = make_dataset()
+    files = dataset.dataset['file 0'].to_numpy()
+    sampler = FileLocalitySampler(dataset, window=2, seed=1,
+                                  num_replicas=1, rank=0)
+
+    indices = list(sampler)
+    assert sorted(indices) == list(range(200))
+
+    # Each window of 40 samples only uses two files
+    for start in range(0, 200, 40):
+        assert len(set(files[indices[start:start + 40]])) == 2
+
+    # Samples are shuffled within the windows
+    assert indices != sorted(indices)
+    assert list(sampler) == indices
+
+    sampler.set_epoch(1)
+    assert list(sampler) != indices
+
+
+def test_file_locality_sampler_distributed():
+    dataset = make_dataset(files=7)
+    files = dataset.dataset['file 0'].to_numpy()
+    samplers = [FileLocalitySampler(dataset, window=2, num_replicas=3,
+                                    rank=rank) for rank in range(3)]
+    indices = [list(sampler) for sampler in samplers]
+
+    assert all(len(i) == len(s) == 60 for i, s in zip(indices, samplers))
+    assert set().union(*indices) == set(range(140))
+
+    # Each file is only read by one replica
+    rank_files = [set(files[i]) for i in indices]
+    assert sum(len(f) for f in rank_files) == 7
+    assert len(set().union(*rank_files)) == 7
+
+
+def test_file_locality_sampler_few_files():
+    dataset = make_dataset(files=2, samples=10)
+    samplers = [FileLocalitySampler(dataset, num_replicas=3, rank=rank)
+                for rank in range(3)]
+    indices = [list(sampler) for sampler in samplers]
+
+    assert all(len(i) == len(s) == 10 for i, s in zip(indices, samplers))
+    assert set().union(*indices) == set(range(20))
+
+    with pytest.raises(ValueError):
+        FileLocalitySampler(make_dataset(files=1, samples=2),
+                            num_replicas=3, rank=0)
+
+
+def test_file_locality_sampler_empty():
+    for num_replicas in [1, 2]:
+        sampler = FileLocalitySampler(make_dataset(files=1, samples=0),
+                                      num_replicas=num_replicas, rank=0)
+        assert len(sampler) == 0
+        assert list(sampler) == []
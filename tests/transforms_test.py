@@ -0,0 +1,181 @@
+import numpy as np
+import pytest
+import torch
+
+from spacephyml import transforms as tf
+
+
+def test_ion_dist_transform_batch():
+    rng = np.random.default_rng(0)
+    batch = (rng.random((4, 32, 16, 32)) * 1e-18).astype(np.float32)
+    transform = tf.IonDist_Transform()
+
+    assert transform.batchable
+    expected = torch.stack([transform(x.copy()) for x in batch])
+    result = transform(batch.copy())
+
+    assert result.shape == (4, 1, 32, 16, 32)
+    assert torch.equal(result, expected)
+
+
+def test_batchable():
+    assert tf.Compose(tf.Threshold((0, 1)), tf.Roll()).batchable
+    assert not tf.Compose(tf.Threshold((0, 1)), tf.Flatten()).batchable
+    assert not tf.Compose(tf.Threshold((0, 1)),
+                          lambda x: x).batchable
+    assert not tf.LogNorm().batchable
+    assert not tf.Roll(axis=0).batchable
+    assert not tf.Sum(axis=None).batchable
+    assert tf.Sum(axis=(-1, -2)).batchable
+
+
+def test_clip_log_norm():
+    rng = np.random.default_rng(0)
+    sample = (10.0 ** rng.uniform(-30, -15, (32, 16, 32))).astype(np.float32)
+    sample[0, 0, :3] = [0, 1e-28, 1e-17]
+
+    expected = tf.LogNorm((-28, -17))(
+        tf.Threshold((np.power(10.0, -28), np.power(10.0, -17)))(
+            sample.copy()))
+
+    x = sample.copy()
+    result = tf.ClipLogNorm((-28, -17))(x)
+    assert result is x
+    assert np.array_equal(result, expected)
+
+    out = np.empty(sample.shape, dtype=np.float32)
+    result = tf.ClipLogNorm((-28, -17))(sample.astype(np.float64), out=out)
+    assert result is out
+    assert np.allclose(result, expected, atol=1e-6)
+
+    result = tf.ClipLogNorm((-28, -17), dtype=np.float32)(
+        sample.astype(np.float64))
+    assert result.dtype == np.float32
+    assert np.allclose(result, expected, atol=1e-6)
+
+
+def test_compose_compile():
+    rng = np.random.default_rng(0)
+    sample = (10.0 ** rng.uniform(-30, -15, (4, 32, 16, 32)))
+    sample = sample.astype(np.float32)
+
+    composes = [
+        tf.IonDist_Transform(),
+        tf.Compose(tf.Threshold((1e-28, 1e-17)), tf.LogNorm((-28, -17)),
+                   tf.ZScoreNorm(np.float64(0.5), 2), tf.Roll(),
+                   tf.Sum(axis=-1), tf.Flatten()),
+        tf.Compose(tf.LogNorm(), tf.Roll(), tf.Mean(axis=(-3, -1))),
+        tf.Compose(tf.Log10(), tf.MoveAxis(), tf.Roll(shift=3, axis=-1),
+                   tf.Sum(axis=-3)),
+        tf.Compose(tf.ZScoreNorm(1e-20, 1e-20), lambda x: x * 2),
+    ]
+    for compose in composes:
+        expected = compose(sample.copy())
+        result = compose.compile()(sample.copy())
+        assert result.dtype == expected.dtype
+        assert result.shape == expected.shape
+        assert np.allclose(result, expected, rtol=1e-6)
+
+    compiled = composes[1].compile()
+    # The sum is taken before the roll
+    assert [type(t) for t in compiled.transforms][1:] == \
+        [tf.Sum, tf._IndexRoll, tf.Flatten]
+    assert np.array_equal(compiled(sample[0].copy()),
+                          composes[1](sample[0].copy()))
+
+    # Integer samples are converted to float, as without compiling
+    compose = tf.Compose(tf.ZScoreNorm(1, 2))
+    expected = compose(np.arange(5))
+    result = compose.compile()(np.arange(5))
+    assert result.dtype == expected.dtype == np.float64
+    assert np.array_equal(result, expected)
+    compose = tf.Compose(tf.Sum(axis=-1), tf.ZScoreNorm(np.arange(3), 2))
+    sample = np.arange(12).reshape(3, 4)
+    assert np.array_equal(compose.compile()(sample), compose(sample))
+
+
+def test_torch_batch():
+    rng = np.random.default_rng(0)
+    batch = (10.0 ** rng.uniform(-30, -15, (4, 32, 16, 32)))
+    batch = batch.astype(np.float32)
+
+    composes = [
+        tf.IonDist_Transform(),
+        tf.Compose(tf.Threshold((1e-28, 1e-17)), tf.LogNorm((-28, -17)),
+                   tf.Roll(), tf.MoveAxis(), tf.Sum(axis=-1)),
+        tf.Compose(tf.Log10(), tf.ZScoreNorm(-20, 2), tf.Mean(axis=-2)),
+    ]
+    for compose in composes:
+        expected = [compose(x.copy()) for x in batch]
+        for transform in [compose, compose.compile()]:
+            result = transform(torch.from_numpy(batch.copy()))
+            assert isinstance(result, torch.Tensor)
+            for x, y in zip(result, expected):
+                assert np.allclose(x.numpy(), np.asarray(y), rtol=1e-5,
+                                   atol=1e-5)
+
+
+def test_batch_mode():
+    rng = np.random.default_rng(0)
+    data = (10.0 ** rng.uniform(-30, -15, (6, 32, 16, 32)))
+    data = data.astype(np.float32)
+
+    class Dataset():
+        transform = tf.IonDist_Transform()
+
+        def __len__(self):
+            return len(data)
+
+        def __getitem__(self, idx):
+            x = data[idx].copy()
+            if self.transform:
+                x = self.transform(x)
+            return [x, idx]
+
+    dataset = Dataset()
+    expected = [dataset[i][0] for i in range(6)]
+
+    loader = torch.utils.data.DataLoader(dataset, batch_size=4,
+                                         collate_fn=tf.batch_mode(dataset))
+    assert dataset.transform is None
+    result, idx = next(iter(loader))
+    assert result.shape == (4, 1, 32, 16, 32)
+    assert idx.tolist() == [0, 1, 2, 3]
+    assert torch.allclose(result, torch.stack(expected[:4]), atol=1e-6)
+
+    with pytest.raises(ValueError):
+        tf.BatchCollate(tf.Flatten())
+
+
+def test_fit():
+    rng = np.random.default_rng(0)
+    data = (10.0 ** rng.uniform(-30, -15, (50, 4, 8))).astype(np.float32)
+    data[0, 0, 0] = 0
+    dataset = [[x, 0] for x in data]
+
+    norm = tf.ZScoreNorm.fit(dataset, batch_size=16)
+    assert np.isclose(norm.mean, data.astype(np.float64).mean())
+    assert np.isclose(norm.std, data.astype(np.float64).std())
+
+    norm = tf.ZScoreNorm.fit(dataset, channel_axis=-2, batch_size=16)
+    assert norm(data).shape == data.shape
+    assert norm(data).dtype == np.float32
+    assert norm(torch.from_numpy(data)).dtype == torch.float32
+    assert np.allclose(norm(data).mean(axis=(0, 2)), 0, atol=1e-6)
+
+    # The statistics computed by each worker are merged
+    parallel = tf.ZScoreNorm.fit(dataset, channel_axis=-2, batch_size=16,
+                                 num_workers=2)
+    assert np.allclose(parallel.mean, norm.mean)
+    assert np.allclose(parallel.std, norm.std)
+    assert parallel.mean.dtype == np.float32
+
+    log = np.log10(data[data > 0].astype(np.float64))
+    norm = tf.LogNorm.fit(dataset, batch_size=16)
+    assert np.allclose(norm.normalization, (log.min(), log.max()))
+    assert norm(data.copy()).dtype == np.float32
+
+    norm = tf.LogNorm.fit(dataset, channel_axis=-1, batch_size=16)
+    assert norm(data.copy()).dtype == np.float32
+    assert norm(torch.from_numpy(data)).dtype == torch.float32
+    assert norm.batchable
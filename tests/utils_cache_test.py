@@ -0,0 +1,142 @@
+import multiprocessing
+import pickle
+import time
+
+import numpy as np
+import pytest
+
+from spacephyml.utils.cache import LRUCache, load_shared_array, config_hash, \
+    file_hash
+
+
+def test_lru_cache_eviction():
+    cache = LRUCache(max_bytes=300)
+    for key in 'abc':
+        cache.put(key, np.zeros(100, dtype=np.uint8))
+    cache.get('a')
+    cache.put('d', np.zeros(100, dtype=np.uint8))
+
+    # b is the least recently used
+    assert 'b' not in cache
+    assert all(key in cache for key in 'acd')
+    assert cache.get('b') is None
+    assert cache.stats() == {'hits': 1, 'misses': 1, 'evictions': 1,
+                             'entries': 3, 'nbytes': 300}
+
+
+def test_lru_cache_too_large():
+    cache = LRUCache(max_bytes=100)
+    cache.put('a', np.zeros(50, dtype=np.uint8))
+    cache.put('b', np.zeros(200, dtype=np.uint8))
+
+    assert 'a' in cache
+    assert 'b' not in cache
+
+
+def test_lru_cache_pinned():
+    cache = LRUCache(max_bytes=200, pinned=['a'])
+    for key in 'abcd':
+        cache.put(key, np.zeros(100, dtype=np.uint8))
+
+    assert 'a' in cache
+    assert 'b' not in cache
+    assert cache.nbytes == 200
+
+    cache.unpin('a')
+    assert 'a' not in cache
+    assert cache.stats()['evictions'] == 2
+
+
+def test_load_shared_array(tmp_path):
+    source = tmp_path / 'file.cdf'
+    source.write_bytes(b'0000')
+    calls = []
+
+    def read():
+        calls.append(1)
+        return np.arange(len(source.read_bytes()))
+
+    first = load_shared_array(str(tmp_path / 'shared'), str(source), 'var',
+                              read)
+    second = load_shared_array(str(tmp_path / 'shared'), str(source), 'var',
+                               read)
+    assert len(calls) == 1
+    assert not second.flags.writeable
+    assert list(first) == list(second) == [0, 1, 2, 3]
+
+    # Changing the source file rebuilds the scratch file
+    source.write_bytes(b'000000')
+    assert list(load_shared_array(str(tmp_path / 'shared'), str(source),
+                                  'var', read)) == list(range(6))
+    assert len(list((tmp_path / 'shared').glob('*.npy'))) == 1
+
+
+def _load_counted(tmp_path):
+    def read():
+        # Count the reads, slow enough for the processes to overlap
+        with open(tmp_path / 'reads', 'a', encoding='utf-8') as f:
+            f.write('1')
+        time.sleep(0.2)
+        return np.arange(4)
+
+    load_shared_array(str(tmp_path / 'shared'), str(tmp_path / 'file.cdf'),
+                      'var', read)
+
+
+def test_load_shared_array_processes(tmp_path):
+    (tmp_path / 'file.cdf').write_bytes(b'0000')
+
+    ctx = multiprocessing.get_context('fork')
+    processes = [ctx.Process(target=_load_counted, args=(tmp_path,))
+                 for _ in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    assert all(process.exitcode == 0 for process in processes)
+    assert (tmp_path / 'reads').read_text(encoding='utf-8') == '1'
+
+
+def test_config_hash():
+    from spacephyml.transforms import IonDist_Transform, ZScoreNorm
+
+    assert config_hash(IonDist_Transform(), '0.1.0') == \
+        config_hash(IonDist_Transform(), '0.1.0')
+    assert config_hash(IonDist_Transform()) != \
+        config_hash(IonDist_Transform((-27, -17)))
+    assert config_hash(ZScoreNorm(np.zeros(3), 1)) != \
+        config_hash(ZScoreNorm(np.ones(3), 1))
+
+    with pytest.raises(ValueError):
+        config_hash(lambda x: x)
+
+
+def test_lru_cache_pickle():
+    cache = LRUCache(max_bytes=300, pinned=['a'])
+    cache.put('a', np.zeros(100, dtype=np.uint8))
+    cache.put('b', np.zeros(100, dtype=np.uint8))
+
+    copy = pickle.loads(pickle.dumps(cache))
+    assert len(copy) == 0 and copy.nbytes == 0
+    assert copy.max_bytes == 300 and copy.pinned == {'a'}
+    copy.put('c', np.zeros(100, dtype=np.uint8))
+    assert 'c' in copy
+
+
+def test_file_hash(tmp_path, mocker):
+    dataset = tmp_path / 'dataset.parquet'
+    (dataset / 'month=2017-11').mkdir(parents=True)
+    part = dataset / 'month=2017-11' / 'part-0.parquet'
+    part.write_bytes(b'0000')
+    first = file_hash(str(dataset))
+
+    # The files are not read
+    read = mocker.patch('builtins.open', side_effect=AssertionError)
+    assert file_hash(str(dataset)) == first
+    read.assert_not_called()
+    mocker.stopall()
+
+    part.write_bytes(b'00000000')
+    assert file_hash(str(dataset)) != first
+    assert file_hash(str(part)) != file_hash(str(dataset))
@@ -0,0 +1,47 @@
+import os
+
+import numpy as np
+from cdflib.cdfwrite import CDF
+
+from spacephyml.utils.cdf_pool import CDFPool
+
+
+def _write_cdf(filepath, values):
+    cdf_file = CDF(str(filepath), cdf_spec={'rDim_sizes': []})
+    cdf_file.write_var({'Variable': 'var', 'Data_Type': 21,
+                        'Num_Elements': 1, 'Rec_Vary': True,
+                        'Dim_Sizes': []}, var_data=np.asarray(values))
+    cdf_file.close()
+
+
+def test_cdf_pool(tmp_path):
+    for i in range(3):
+        _write_cdf(tmp_path / f'{i}.cdf', [i, i + 1])
+
+    pool = CDFPool(max_open=2)
+    for i in [0, 1, 0, 2]:
+        with pool.open(str(tmp_path / f'{i}.cdf')) as cdf_file:
+            assert list(cdf_file.varget('var')) == [i, i + 1]
+
+    assert (pool.hits, pool.misses) == (1, 3)
+    assert len(pool) == 2
+
+    # File 1 was evicted
+    with pool.open(str(tmp_path / '1.cdf')):
+        pass
+    assert pool.misses == 4
+
+
+def test_cdf_pool_reopen_changed(tmp_path):
+    filepath = tmp_path / 'file.cdf'
+    _write_cdf(filepath, [1, 2])
+
+    pool = CDFPool()
+    with pool.open(str(filepath)) as cdf_file:
+        assert list(cdf_file.varget('var')) == [1, 2]
+
+    os.remove(filepath)
+    _write_cdf(filepath, [3, 4, 5])
+    with pool.open(str(filepath)) as cdf_file:
+        assert list(cdf_file.varget('var')) == [3, 4, 5]
+    assert pool.misses == 2
@@ -0,0 +1,75 @@
+import os
+
+import numpy as np
+import pytest
+
+from spacephyml.utils import epochs
+
+
+def test_read_cdf_epochs_index(tmp_path, mocker):
+    cdf_path = tmp_path / 'mms' / 'file.cdf'
+    cdf_path.parent.mkdir()
+    cdf_path.write_bytes(b'0000')
+    read = mocker.patch('spacephyml.utils.epochs.read_cdf_file',
+                        return_value={'epoch': [1, 2, 3]})
+
+    first = epochs.read_cdf_epochs(str(tmp_path), 'mms/file.cdf')
+    second = epochs.read_cdf_epochs(str(tmp_path), 'mms/file.cdf')
+
+    read.assert_called_once()
+    assert second.dtype == np.int64
+    assert list(first) == list(second) == [1, 2, 3]
+
+
+def test_read_cdf_epochs_rebuild(tmp_path, mocker):
+    cdf_path = tmp_path / 'file.cdf'
+    cdf_path.write_bytes(b'0000')
+    read = mocker.patch('spacephyml.utils.epochs.read_cdf_file',
+                        return_value={'epoch': [1, 2, 3]})
+    epochs.read_cdf_epochs(str(tmp_path), 'file.cdf')
+
+    cdf_path.write_bytes(b'00000000')
+    read.return_value = {'epoch': [4, 5]}
+    assert list(epochs.read_cdf_epochs(str(tmp_path), 'file.cdf')) == [4, 5]
+    assert len(os.listdir(tmp_path / '.epoch_index')) == 1
+
+
+def test_read_cdf_epochs_concurrent(tmp_path, mocker):
+    cdf_path = tmp_path / 'file.cdf'
+    cdf_path.write_bytes(b'0000')
+    index_filepath = epochs._index_filepath(str(tmp_path / '.epoch_index'),
+                                            str(cdf_path))
+
+    def read(*args):
+        # Another process stores the entry while this one reads the file
+        os.makedirs(tmp_path / '.epoch_index', exist_ok=True)
+        np.save(index_filepath, np.array([1, 2, 3]))
+        return {'epoch': [1, 2, 3]}
+
+    mocker.patch('spacephyml.utils.epochs.read_cdf_file', side_effect=read)
+    remove = mocker.patch('spacephyml.utils.epochs.remove')
+
+    assert list(epochs.read_cdf_epochs(str(tmp_path), 'file.cdf')) == \
+        [1, 2, 3]
+    remove.assert_not_called()
+
+    # Entries removed by other processes fall back to the read epochs
+    os.remove(index_filepath)
+    mocker.patch('spacephyml.utils.epochs.replace',
+                 side_effect=lambda src, dst: os.remove(src))
+    assert list(epochs.read_cdf_epochs(str(tmp_path), 'file.cdf')) == \
+        [1, 2, 3]
+
+
+def test_epoch_to_record():
+    file_epochs = np.array([10, 20, 30, 40])
+    assert list(epochs.epoch_to_record(file_epochs, [30, 10, 40])) == \
+        [2, 0, 3]
+
+    unsorted = np.array([30, 10, 40, 20])
+    assert list(epochs.epoch_to_record(unsorted, [20, 30])) == [3, 0]
+
+    with pytest.raises(ValueError):
+        epochs.epoch_to_record(file_epochs, [25])
+    with pytest.raises(ValueError):
+        epochs.epoch_to_record(file_epochs, [50])
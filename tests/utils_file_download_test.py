@@ -0,0 +1,84 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from spacephyml.utils import file_download
+
+FILES = {f'/file{i}.cdf': bytes(range(256)) * (i + 1) * 100 for i in range(5)}
+
+
+class FileHandler(BaseHTTPRequestHandler):
+    """
+    Serve FILES, with support for HTTP Range requests.
+    """
+    ranges = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path not in FILES:
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        data = FILES[self.path]
+        start = 0
+        if 'Range' in self.headers:
+            start = int(self.headers['Range'].split('=')[1].split('-')[0])
+            self.ranges.append((self.path, start))
+            self.send_response(206)
+            self.send_header('Content-Range',
+                             f'bytes {start}-{len(data)-1}/{len(data)}')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(data) - start))
+        self.end_headers()
+        self.wfile.write(data[start:])
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), FileHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{httpd.server_address[1]}'
+    httpd.shutdown()
+    FileHandler.ranges.clear()
+
+
+def test_download_file_with_status(server, tmp_path):
+    filepath = tmp_path / 'file0.cdf'
+    file_download.download_file_with_status(f'{server}/file0.cdf',
+                                            str(filepath))
+
+    assert filepath.read_bytes() == FILES['/file0.cdf']
+    assert not (tmp_path / 'file0.cdf.part').exists()
+
+
+def test_download_files(server, tmp_path):
+    downloads = [(f'{server}{name}', str(tmp_path / name[1:]))
+                 for name in FILES]
+    file_download.download_files(downloads, workers=3)
+
+    for name, data in FILES.items():
+        assert (tmp_path / name[1:]).read_bytes() == data
+
+
+def test_download_files_resume(server, tmp_path):
+    data = FILES['/file3.cdf']
+    (tmp_path / 'file3.cdf.part').write_bytes(data[:1000])
+
+    file_download.download_files(
+            [(f'{server}/file3.cdf', str(tmp_path / 'file3.cdf'))])
+
+    assert FileHandler.ranges == [('/file3.cdf', 1000)]
+    assert (tmp_path / 'file3.cdf').read_bytes() == data
+
+
+def test_download_files_missing(server, tmp_path):
+    with pytest.raises(Exception):
+        file_download.download_files(
+                [(f'{server}/missing.cdf', str(tmp_path / 'missing.cdf'))])
+    assert not (tmp_path / 'missing.cdf').exists()
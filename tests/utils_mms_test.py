@@ -2,6 +2,8 @@ import pytest
 
 import tempfile
 
+from requests_mock import ANY
+
 import spacephyml.utils.mms as mms
 
 
@@ -49,3 +51,33 @@ def test_download_cdf_files(mocker, requests_mock):
 
 
 
+
+def test_get_file_list_cache(requests_mock, tmp_path):
+    files = [{'file_name': 'mms1_fpi_fast_l2_dis-dist_20171201000000_v3.4.0.cdf'},
+             {'file_name': 'mms1_fpi_fast_l2_dis-dist_20171202000000_v3.4.0.cdf'}]
+    adapter = requests_mock.get(ANY, json={'files': files})
+
+    first = mms.get_file_list('2017-12-01', '2017-12-03', datatype='dis-dist',
+                              rootdir=str(tmp_path))
+    second = mms.get_file_list('2017-12-02', '2017-12-03',
+                               datatype='dis-dist', rootdir=str(tmp_path))
+
+    assert adapter.call_count == 1
+    assert first == files
+    assert second == files[1:]
+
+def test_get_file_list_offline(tmp_path):
+    dirpath = tmp_path / 'mms/mms1/fpi/fast/l2/dis-dist/2017/12'
+    dirpath.mkdir(parents=True)
+    for filename in ['mms1_fpi_fast_l2_dis-dist_20171201000000_v3.3.0.cdf',
+                     'mms1_fpi_fast_l2_dis-dist_20171201000000_v3.4.0.cdf',
+                     'mms1_fpi_fast_l2_dis-dist_20171202000000_v3.4.0.cdf',
+                     'mms1_fpi_fast_l2_dis-dist_20171203000000_v3.4.0.cdf']:
+        (dirpath / filename).write_bytes(b'0')
+
+    files = mms.get_file_list('2017-12-01', '2017-12-03', datatype='dis-dist',
+                              rootdir=str(tmp_path), offline=True)
+
+    assert [f['file_name'] for f in files] == \
+        ['mms1_fpi_fast_l2_dis-dist_20171201000000_v3.4.0.cdf',
+         'mms1_fpi_fast_l2_dis-dist_20171202000000_v3.4.0.cdf']
@@ -0,0 +1,41 @@
+import threading
+
+from spacephyml.utils.prefetch import Prefetcher
+
+
+def test_prefetcher():
+    read_keys = []
+    release = threading.Event()
+
+    def read(key):
+        release.wait()
+        read_keys.append(key)
+        return key * 2
+
+    prefetcher = Prefetcher(read, depth=2)
+    prefetcher.request([1, 2, 3])
+    release.set()
+
+    assert prefetcher.get(1) == 2
+    assert prefetcher.get(2) == 4
+    # Only depth keys are read ahead
+    assert prefetcher.get(3) is None
+
+    prefetcher.request([4])
+    prefetcher.request([5])
+    assert prefetcher.get(5) == 10
+    assert prefetcher.get(4) is None
+    prefetcher.close()
+
+    assert read_keys[:2] == [1, 2]
+    assert 3 not in read_keys
+
+
+def test_prefetcher_read_error():
+    def read(key):
+        raise OSError('Corrupt file')
+
+    prefetcher = Prefetcher(read)
+    prefetcher.request(['file.cdf'])
+    prefetcher.close()
+    assert prefetcher.get('file.cdf') is None
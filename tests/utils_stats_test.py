@@ -0,0 +1,32 @@
+import numpy as np
+
+from spacephyml.utils.stats import RunningStats
+
+
+def test_running_stats():
+    rng = np.random.default_rng(0)
+    data = rng.normal(3, 2, (100, 4, 5))
+
+    stats = RunningStats()
+    for start in range(0, 100, 30):
+        stats.update(data[start:start + 30])
+
+    assert np.isclose(stats.mean, data.mean())
+    assert np.isclose(stats.std, data.std())
+    assert (stats.min, stats.max) == (data.min(), data.max())
+
+    # Per channel, merging the statistics of two parts
+    first, second = RunningStats(-2), RunningStats(-2)
+    first.update(data[:40])
+    second.update(data[40:])
+    first.merge(second)
+
+    assert first.mean.shape == (4, 1)
+    assert np.allclose(first.mean[:, 0], data.mean(axis=(0, 2)))
+    assert np.allclose(first.std[:, 0], data.std(axis=(0, 2)))
+
+
+def test_running_stats_nonfinite():
+    stats = RunningStats()
+    stats.update(np.array([[1.0, np.nan], [-np.inf, 3.0]]))
+    assert (stats.count, stats.mean, stats.min) == (2, 2.0, 1.0)
@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+import pytest
+from cdflib.cdfwrite import CDF
+
+from spacephyml.utils import read_cdf_file, pandas_read_file
+
+
+def test_read_cdf_file_records(tmp_path):
+    values = np.arange(20 * 3, dtype=np.float32).reshape(20, 3)
+    cdf_file = CDF(str(tmp_path / 'file.cdf'), cdf_spec={'rDim_sizes': []})
+    cdf_file.write_var({'Variable': 'var', 'Data_Type': 21,
+                        'Num_Elements': 1, 'Rec_Vary': True,
+                        'Dim_Sizes': [3], 'Var_Type': 'zVariable'},
+                       var_data=values)
+    cdf_file.close()
+
+    filepath = str(tmp_path / 'file.cdf')
+    records = [7, 2, 3, 3, 15, 4]
+    data = read_cdf_file(filepath, [('var', 'var')], records=records)['var']
+    assert np.array_equal(data, values[records])
+
+    data = read_cdf_file(filepath, [('var', 'var')],
+                         records=range(5, 9))['var']
+    assert np.array_equal(data, values[5:9])
+
+    data = read_cdf_file(filepath, [('var', 'var')], records=[])['var']
+    assert data.shape == (0, 3)
+
+
+@pytest.mark.parametrize('fileformat', ['csv', 'feather'])
+def test_pandas_read_file_categorical(tmp_path, fileformat):
+    filepath = str(tmp_path / f'dataset.{fileformat}')
+    dataset = pd.DataFrame({'label': [0, 1, 2],
+                            'file 0': ['a.cdf', 'b.cdf', 'a.cdf']})
+    getattr(dataset, f'to_{fileformat}')(filepath)
+
+    read = pandas_read_file(filepath,
+                            categorical=lambda c: c.startswith('file '))
+    assert read['file 0'].dtype == 'category'
+    assert list(read['file 0'].cat.categories) == ['a.cdf', 'b.cdf']
+    assert read['label'].dtype == np.int64
@@ -0,0 +1,38 @@
+import numpy as np
+from cdflib.cdfwrite import CDF
+
+from spacephyml.utils import verify
+
+
+def write_cdf(filepath):
+    cdf_file = CDF(str(filepath), cdf_spec={'rDim_sizes': [],
+                                            'Checksum': True})
+    cdf_file.write_var({'Variable': 'var', 'Data_Type': 21,
+                        'Num_Elements': 1, 'Rec_Vary': True,
+                        'Dim_Sizes': []}, var_data=np.arange(1000.0))
+    cdf_file.close()
+
+
+def test_verify_cdf_files(tmp_path, mocker):
+    for name in ['good.cdf', 'truncated.cdf', 'changed.cdf']:
+        write_cdf(tmp_path / name)
+
+    data = (tmp_path / 'truncated.cdf').read_bytes()
+    (tmp_path / 'truncated.cdf').write_bytes(data[:len(data) // 2])
+
+    data = bytearray((tmp_path / 'changed.cdf').read_bytes())
+    data[len(data) // 2] ^= 0xff
+    (tmp_path / 'changed.cdf').write_bytes(data)
+
+    files = {'good.cdf': ['var'], 'truncated.cdf': ['var'],
+             'changed.cdf': ['var']}
+    corrupt = verify.verify_cdf_files(str(tmp_path), files, workers=2)
+    assert sorted(corrupt) == ['changed.cdf', 'truncated.cdf']
+
+    # Verified files are recorded in the manifest and not checked again
+    check = mocker.spy(verify, '_check_cdf_file')
+    assert verify.verify_cdf_files(str(tmp_path), {'good.cdf': ['var']}) == {}
+    check.assert_not_called()
+
+    assert 'good.cdf' in verify.verify_cdf_files(str(tmp_path),
+                                                 {'good.cdf': ['missing']})